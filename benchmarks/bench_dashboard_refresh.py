@@ -0,0 +1,75 @@
+"""Desktop dashboard refresh time: full list vs. the windowed (keyset paged) table.
+
+For each customer count, times refresh as the app does it: query the rows and
+insert them into a ttk.Treeview. Without a display the Treeview step is
+skipped and only the query and row formatting are timed.
+
+    python benchmarks/bench_dashboard_refresh.py
+    python benchmarks/bench_dashboard_refresh.py --sizes 1000 10000 100000 --repeat 5
+"""
+import argparse
+import time
+
+from common import database, percentile, seed_customers, temp_database
+
+import ledger  # noqa: E402
+
+
+def make_tree():
+    try:
+        import tkinter as tk
+        from tkinter import ttk
+        root = tk.Tk()
+    except Exception as e:
+        print(f"No Treeview available ({e.__class__.__name__}); timing queries only")
+        return None, None
+    root.withdraw()
+    tree = ttk.Treeview(root, columns=("Last Transaction", "Borrower", "Balance"), show="headings")
+    return root, tree
+
+
+def fill(tree, rows):
+    if tree is None:
+        return
+    tree.delete(*tree.get_children())
+    for customer_id, display_name, balance, last_transaction, is_overdue in rows:
+        tree.insert("", "end", values=(last_transaction, display_name + " ⚠️" if is_overdue else display_name,
+                                       f"₱{balance:.2f}"))
+
+
+def time_refresh(fn, tree, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fill(tree, fn())
+        if tree is not None:
+            tree.update_idletasks()
+        samples.append((time.perf_counter() - started) * 1000.0)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    root, tree = make_tree()
+    print(f"page size={ledger.DASHBOARD_PAGE_SIZE}")
+    for size in args.sizes:
+        temp_database(f'dashboard-{size}.db')
+        seed_customers(size, tx_per_customer=1)
+        full = time_refresh(ledger.get_dashboard_rows, tree, args.repeat)
+        windowed = time_refresh(lambda: ledger.get_dashboard_page()[0], tree, args.repeat)
+        cursor = ledger.get_dashboard_page()[1]
+        next_page = time_refresh(lambda: ledger.get_dashboard_page(cursor)[0], None, args.repeat)
+        print(f"{size:>7} customers: full p50={percentile(full, 50):8.1f} ms   "
+              f"windowed p50={percentile(windowed, 50):6.1f} ms   "
+              f"next page query p50={percentile(next_page, 50):5.1f} ms")
+        database.close_connection()
+    if root is not None:
+        root.destroy()
+
+
+if __name__ == '__main__':
+    main()
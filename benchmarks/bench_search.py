@@ -0,0 +1,60 @@
+"""Dashboard search latency with the FTS5 trigram index.
+
+Seeds customers with mixed first/last names and times search.search_customer_ids()
+and the full ledger.get_dashboard_rows() for a few typical terms.
+
+    python benchmarks/bench_search.py --customers 50000
+"""
+import argparse
+import random
+import time
+
+from common import percentile, seed_customers, temp_database, transaction
+
+import ledger  # noqa: E402
+import search  # noqa: E402
+
+FIRST_NAMES = ["maria", "jose", "juan", "ana", "pedro", "rosa", "carlo", "liza", "mark", "joy", "grace", "ramon"]
+LAST_NAMES = ["santos", "reyes", "cruz", "bautista", "ocampo", "garcia", "mendoza", "torres", "flores", "dela cruz"]
+TERMS = ["santos", "ria", "maria reyes", "12345", "ma", "zzz"]
+
+
+def rename_customers(customer_ids, seed=7):
+    rng = random.Random(seed)
+    rows = []
+    for i, cid in enumerate(customer_ids):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}".title()
+        rows.append((name.lower(), name, cid))
+    with transaction() as conn:
+        conn.executemany("UPDATE customers SET name = ?, display_name = ? WHERE id = ?", rows)
+
+
+def time_call(fn, repeat):
+    fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000.0)
+    return result, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--customers', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+
+    temp_database()
+    rename_customers(seed_customers(args.customers, tx_per_customer=1))
+
+    print(f"customers={args.customers} limit={search.SEARCH_LIMIT}")
+    for term in TERMS:
+        ids, search_ms = time_call(lambda: search.search_customer_ids(term), args.repeat)
+        _, rows_ms = time_call(lambda: ledger.get_dashboard_rows(term), args.repeat)
+        print(f"{term!r:>14}: {len(ids):4d} hits  search p50={percentile(search_ms, 50):.2f} ms "
+              f"p99={percentile(search_ms, 99):.2f} ms  dashboard rows p50={percentile(rows_ms, 50):.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""Sync throughput: full and incremental push/pull of a synthetic ledger against a fake cloud.
+
+Seeds device A with a generated ledger (see common.seed_ledger), then times
+sync_all_data() through four phases: A's first push of everything, a fresh
+device B pulling it all, and after a burst of new entries on A (a market
+day), A's incremental push and B's incremental pull. Each phase reports
+documents moved per second, wall time, time spent in backend calls
+(network, including the simulated latency, summed over the engine's threads)
+and wall time minus that (local: SQLite and Python, less whatever overlapped
+the network), plus the process's peak RSS so far. Results are written as JSON
+so runs on different commits can be compared with --compare.
+
+A's incremental sync also reads the whole cloud once: its first pull found
+nothing there, so it has no watermark yet. Incremental pulls re-read the
+documents inside the watermark overlap, which defaults to the app's; the
+setting is printed and recorded with the results. The default 100k/1M ledger
+takes about 20 minutes and 2.5 GB; shrink it for quick comparisons.
+
+    python benchmarks/bench_sync.py
+    python benchmarks/bench_sync.py --customers 10000 --transactions 100000 --latency-ms 0
+    python benchmarks/bench_sync.py --compare sync-abc1234.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from common import database, seed_ledger, temp_database, transaction
+
+import sync_state  # noqa: E402
+from ledger import occurred_at  # noqa: E402
+from sync_backend import MemoryBackend, SyncBackend  # noqa: E402
+from sync_engine import SyncEngine  # noqa: E402
+
+
+class TimedBackend(SyncBackend):
+    """Wraps a backend and adds up the time spent inside its calls, and the documents read."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.seconds = 0.0
+        self.docs_read = 0
+        self._lock = threading.Lock()
+
+    def _add(self, seconds, docs=0):
+        with self._lock:
+            self.seconds += seconds
+            self.docs_read += docs
+
+    def _timed_iter(self, docs):
+        iterator = iter(docs)
+        while True:
+            started = time.perf_counter()
+            try:
+                doc = next(iterator)
+            except StopIteration:
+                self._add(time.perf_counter() - started)
+                return
+            self._add(time.perf_counter() - started, 1)
+            yield doc
+
+    def stream(self, collection):
+        return self._timed_iter(self.backend.stream(collection))
+
+    def query(self, collection, field, after, page_size):
+        return self._timed_iter(self.backend.query(collection, field, after, page_size))
+
+    def new_id(self, collection):
+        return self.backend.new_id(collection)
+
+    def batch(self):
+        return _TimedBatch(self, self.backend.batch())
+
+    def listen(self, collection, callback, field=None, after=None):
+        return self.backend.listen(collection, callback, field, after)
+
+
+class _TimedBatch:
+    def __init__(self, timer, batch):
+        self.timer = timer
+        self.batch = batch
+
+    def set(self, collection, doc_id, data, merge=False):
+        self.batch.set(collection, doc_id, data, merge=merge)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            self.batch.commit()
+        finally:
+            self.timer._add(time.perf_counter() - started)
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_phase(name, path, cloud):
+    database.configure(path)
+    timer = TimedBackend(cloud)
+    engine = SyncEngine(timer)
+    writes_before = cloud.writes
+    started = time.perf_counter()
+    success, message = engine.sync_all_data()
+    wall = time.perf_counter() - started
+    if not success:
+        raise SystemExit(f"{name}: {message}")
+    docs = timer.docs_read + cloud.writes - writes_before
+    result = {'phase': name, 'docs': docs, 'docs_read': timer.docs_read,
+              'docs_written': cloud.writes - writes_before,
+              'wall_s': round(wall, 3), 'network_s': round(timer.seconds, 3),
+              'local_s': round(max(wall - timer.seconds, 0.0), 3),
+              'docs_per_s': round(docs / wall, 1) if wall else None, 'peak_rss_mb': peak_rss_mb()}
+    print(f"{name:<18} {docs:>9} docs  {result['docs_per_s'] or 0:>10.1f} docs/s  wall {wall:8.2f}s  "
+          f"network {timer.seconds:8.2f}s  local {result['local_s']:8.2f}s  peak rss {result['peak_rss_mb']} MB")
+    return result
+
+
+def market_day(customer_ids, changes, seed=7):
+    """Entries a busy day adds on device A: credits and payments, phone edits and deletions."""
+    rng = random.Random(seed)
+    now = datetime.now()
+    with transaction() as conn:
+        for number in range(changes):
+            cid = rng.choice(customer_ids)
+            when = now + timedelta(seconds=number)
+            date, time_ = when.strftime("%Y-%m-%d"), when.strftime("%H:%M")
+            paid = rng.random() < 0.3
+            amount = float(rng.randrange(10, 500))
+            conn.execute('''INSERT INTO transactions
+                            (id, customer_id, date, time, occurred_at, action, product, quantity, amount,
+                             created_at, updated_at, sync_status, is_deleted)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?, ?, ?, 'pending', 0)''',
+                         (str(uuid.uuid4()), cid, date, time_, occurred_at(date, time_),
+                          'Paid' if paid else 'Credit Added', None if paid else 'Rice', amount,
+                          when.isoformat(), when.isoformat()))
+            conn.execute("UPDATE customers SET balance = balance + ?, updated_at = ?, sync_status = 'pending' "
+                         "WHERE id = ?", (-amount if paid else amount, when.isoformat(), cid))
+        # Desktop edits that do not stamp rows themselves
+        for cid in rng.sample(customer_ids, min(len(customer_ids), changes // 10)):
+            conn.execute('UPDATE customers SET phone_number = ? WHERE id = ?',
+                         (f"09{rng.randrange(10 ** 9):09d}", cid))
+        stale = conn.execute('SELECT id FROM transactions WHERE firebase_id IS NOT NULL ORDER BY RANDOM() LIMIT ?',
+                             (changes // 20,)).fetchall()
+        conn.executemany('DELETE FROM transactions WHERE id = ?', stale)
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {phase['phase']: phase for phase in json.load(f)['phases']}
+    print(f"\nversus {baseline_path}:")
+    for phase in results['phases']:
+        old = baseline.get(phase['phase'])
+        if old and old.get('docs_per_s') and phase['docs_per_s']:
+            print(f"{phase['phase']:<18} {phase['docs_per_s'] / old['docs_per_s']:6.2f}x docs/s  "
+                  f"wall {old['wall_s']:.2f}s -> {phase['wall_s']:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--customers', type=int, default=100000)
+    parser.add_argument('--transactions', type=int, default=1000000)
+    parser.add_argument('--changes', type=int, default=5000, help='new entries on the market day')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='simulated time per backend call')
+    parser.add_argument('--overlap-minutes', type=float,
+                        default=sync_state.WATERMARK_OVERLAP.total_seconds() / 60,
+                        help='watermark overlap (default: the app\'s); 0 skips re-reading fresh documents')
+    parser.add_argument('--output', help='JSON results file (default: sync-<commit>.json)')
+    parser.add_argument('--compare', help='earlier JSON results to compare against')
+    args = parser.parse_args()
+
+    sync_state.WATERMARK_OVERLAP = timedelta(minutes=args.overlap_minutes)
+    print(f"watermark overlap {args.overlap_minutes:g} min, latency {args.latency_ms:g} ms per call")
+    cloud = MemoryBackend(latency=args.latency_ms / 1000.0)
+
+    device_a = temp_database('device-a.db')
+    started = time.perf_counter()
+    customer_ids = seed_ledger(args.customers, args.transactions)
+    print(f"seeded {args.customers} customers, {args.transactions} transactions "
+          f"in {time.perf_counter() - started:.1f}s ({device_a})")
+    device_b = temp_database('device-b.db')
+    from schema import upgrade
+    upgrade()
+
+    phases = [run_phase('full push', device_a, cloud),
+              run_phase('full pull', device_b, cloud)]
+    database.configure(device_a)
+    market_day(customer_ids, args.changes)
+    phases += [run_phase('incremental push', device_a, cloud),
+               run_phase('incremental pull', device_b, cloud)]
+
+    commit = git_commit()
+    results = {'commit': commit, 'recorded_at': datetime.now().isoformat(), 'python': platform.python_version(),
+               'platform': platform.platform(), 'args': vars(args),
+               'watermark_overlap_minutes': args.overlap_minutes, 'phases': phases}
+    output = args.output or f"sync-{commit or 'unknown'}.json"
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
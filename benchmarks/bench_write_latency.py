@@ -0,0 +1,122 @@
+"""Write latency of UI entries while a sync pull is applying changes.
+
+Runs a simulated sync thread (fetch a page from the network, then apply it
+locally) next to a simulated cashier adding credits for as long as the sync
+runs, and reports p50/p99 of the cashier's write latency. `--profile legacy` reproduces the old setup:
+rollback journal, no busy timeout and the sync holding its write lock while
+it waits on the network.
+
+    python benchmarks/bench_write_latency.py
+    python benchmarks/bench_write_latency.py --profile legacy
+"""
+import argparse
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from common import database, percentile, seed_customers, temp_database, transaction
+
+LEGACY_PROFILE = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+
+
+def apply_page(rows):
+    with transaction() as conn:
+        conn.executemany("UPDATE customers SET balance = ?, updated_at = ?, sync_status = 'synced' "
+                         "WHERE id = ?", rows)
+
+
+def run_sync(customer_ids, args, hold_lock_during_fetch, sync_failures, ready, done):
+    rng = random.Random(1)
+    database.get_connection()
+    ready.wait()
+    try:
+        for _ in range(args.sync_pages):
+            rows = [(float(rng.randrange(0, 1000)), datetime.now().isoformat(), rng.choice(customer_ids))
+                    for _ in range(args.page_size)]
+            try:
+                if hold_lock_during_fetch:
+                    with transaction():
+                        time.sleep(args.network_ms / 1000.0)
+                        apply_page(rows)
+                else:
+                    time.sleep(args.network_ms / 1000.0)
+                    apply_page(rows)
+            except sqlite3.OperationalError:
+                sync_failures.append(1)
+    finally:
+        done.set()
+        database.close_connection()
+
+
+def run_ui(customer_ids, args, latencies, failures, ready, done):
+    rng = random.Random(2)
+    database.get_connection()
+    ready.wait()
+    try:
+        while not done.is_set():
+            cid = rng.choice(customer_ids)
+            now = datetime.now()
+            started = time.perf_counter()
+            try:
+                with transaction() as conn:
+                    conn.execute('''INSERT INTO transactions
+                                    (id, customer_id, date, time, action, product, quantity, amount,
+                                     created_at, updated_at, sync_status, is_deleted)
+                                    VALUES (?, ?, ?, ?, 'Credit Added', 'Item', 1, 10, ?, ?, 'pending', 0)''',
+                                 (str(uuid.uuid4()), cid, now.strftime("%Y-%m-%d"), now.strftime("%H:%M"),
+                                  now.isoformat(), now.isoformat()))
+                    conn.execute("UPDATE customers SET balance = balance + 10, updated_at = ?, "
+                                 "sync_status = 'pending' WHERE id = ?", (now.isoformat(), cid))
+                latencies.append((time.perf_counter() - started) * 1000.0)
+            except sqlite3.OperationalError:
+                failures.append(1)
+            time.sleep(args.think_ms / 1000.0)
+    finally:
+        database.close_connection()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profile', choices=['wal', 'legacy'], default='wal')
+    parser.add_argument('--customers', type=int, default=5000)
+    parser.add_argument('--sync-pages', type=int, default=40)
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--network-ms', type=float, default=50.0, help='simulated fetch time per page')
+    parser.add_argument('--think-ms', type=float, default=5.0, help='pause between cashier entries')
+    args = parser.parse_args()
+
+    legacy = args.profile == 'legacy'
+    if legacy:
+        database.STORAGE_PROFILE = LEGACY_PROFILE
+        database.BUSY_TIMEOUT = 0
+        database.LOCK_RETRIES = 0
+
+    path = temp_database()
+    customer_ids = seed_customers(args.customers, tx_per_customer=1)
+    database.close_connection()
+
+    latencies, failures, sync_failures = [], [], []
+    ready = threading.Barrier(3)
+    done = threading.Event()
+    sync_thread = threading.Thread(target=run_sync, args=(customer_ids, args, legacy, sync_failures, ready, done))
+    ui_thread = threading.Thread(target=run_ui, args=(customer_ids, args, latencies, failures, ready, done))
+    sync_thread.start()
+    ui_thread.start()
+    ready.wait()
+    started = time.perf_counter()
+    sync_thread.join()
+    ui_thread.join()
+    elapsed = time.perf_counter() - started
+
+    print(f"profile={args.profile} db={path}")
+    print(f"ui writes: {len(latencies)} ok, {len(failures)} failed (database is locked) in {elapsed:.2f}s")
+    print(f"sync pages: {args.sync_pages - len(sync_failures)} applied, {len(sync_failures)} failed")
+    print(f"write latency p50={percentile(latencies, 50):.2f} ms  "
+          f"p99={percentile(latencies, 99):.2f} ms  max={max(latencies, default=0):.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
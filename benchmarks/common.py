@@ -0,0 +1,122 @@
+"""Helpers shared by the benchmark scripts: import path setup and synthetic data."""
+import itertools
+import os
+import random
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from database import transaction  # noqa: E402
+import schema  # noqa: E402
+from ledger import occurred_at  # noqa: E402
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def temp_database(name='bench.db'):
+    """Point the connection manager at a fresh database file and return its path."""
+    path = os.path.join(tempfile.mkdtemp(prefix='utracker-bench-'), name)
+    database.configure(path)
+    return path
+
+
+def seed_customers(count, tx_per_customer=3, seed=42):
+    """Fill the current database with `count` customers and a few credits each."""
+    rng = random.Random(seed)
+    start = datetime.now() - timedelta(days=120)
+    customers, transactions = [], []
+    for i in range(count):
+        cid = str(uuid.uuid4())
+        name = f"Borrower {i:06d}"
+        balance = 0.0
+        for _ in range(tx_per_customer):
+            when = start + timedelta(minutes=rng.randrange(120 * 24 * 60))
+            amount = float(rng.randrange(5, 500))
+            balance += amount
+            date, time = when.strftime("%Y-%m-%d"), when.strftime("%H:%M")
+            transactions.append((str(uuid.uuid4()), cid, date, time, occurred_at(date, time), "Credit Added",
+                                 "Item", 1, amount, None, when.isoformat(), when.isoformat(), 'synced'))
+        now = datetime.now().isoformat()
+        customers.append((cid, name.lower(), name, None, balance, now, now, 'synced'))
+    schema.upgrade()
+    with transaction() as conn:
+        conn.executemany('''INSERT INTO customers
+                            (id, name, display_name, phone_number, balance, created_at, updated_at, sync_status)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', customers)
+        conn.executemany('''INSERT INTO transactions
+                            (id, customer_id, date, time, occurred_at, action, product, quantity, amount,
+                             actual_borrower, created_at, updated_at, sync_status, is_deleted)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)''', transactions)
+    return [c[0] for c in customers]
+
+
+SEED_CHUNK = 50000
+
+
+def _ledger_day(rng, start, days):
+    """A day in the range, Saturdays (market day) about three times as busy as the rest."""
+    while True:
+        day = start + timedelta(days=rng.randrange(days))
+        if day.weekday() == 5 or rng.random() < 1 / 3:
+            return day
+
+
+def seed_ledger(customers, transactions, seed=42, days=365):
+    """Fill the current database with an unsynced ledger shaped like a busy store's.
+
+    Activity is skewed (a few regulars carry most of the entries), dates
+    bunch up on Saturdays, and the mix has payments, overdue penalties,
+    co-borrowers and soft-deleted rows. Every row is 'pending', so the
+    outbox holds all of it. Returns the customer ids.
+    """
+    rng = random.Random(seed)
+    start = datetime.now() - timedelta(days=days)
+    schema.upgrade()
+    ids = [str(uuid.uuid4()) for _ in range(customers)]
+    weights = list(itertools.accumulate(rng.paretovariate(1.5) for _ in ids))
+    balances = dict.fromkeys(ids, 0.0)
+    products = ['Rice', 'Sugar', 'Canned goods', 'Soap', 'Cooking oil', 'Coffee', 'Noodles', 'Load']
+    for offset in range(0, transactions, SEED_CHUNK):
+        rows = []
+        for cid in rng.choices(ids, cum_weights=weights, k=min(SEED_CHUNK, transactions - offset)):
+            when = datetime.combine(_ledger_day(rng, start, days).date(),
+                                    datetime.min.time()) + timedelta(minutes=rng.randrange(6 * 60, 20 * 60))
+            roll = rng.random()
+            if roll < 0.70:
+                action, product, amount = 'Credit Added', rng.choice(products), float(rng.randrange(10, 800))
+            elif roll < 0.95:
+                action, product, amount = 'Paid', None, float(rng.randrange(20, 1000))
+            else:
+                action, product, amount = 'Overdue Penalty', None, round(balances[cid] * 0.05, 2)
+            borrower = f"Co-borrower {rng.randrange(customers)}" if rng.random() < 0.15 else None
+            deleted = 1 if rng.random() < 0.02 else 0
+            if not deleted:
+                balances[cid] += -amount if action == 'Paid' else amount
+            date, time = when.strftime("%Y-%m-%d"), when.strftime("%H:%M")
+            rows.append((str(uuid.uuid4()), cid, date, time, occurred_at(date, time), action, product,
+                         rng.randrange(1, 6) if product else 1, amount, borrower,
+                         when.isoformat(), when.isoformat(), deleted))
+        with transaction() as conn:
+            conn.executemany('''INSERT INTO transactions
+                                (id, customer_id, date, time, occurred_at, action, product, quantity, amount,
+                                 actual_borrower, created_at, updated_at, sync_status, is_deleted)
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'pending', ?)''', rows)
+    now = datetime.now().isoformat()
+    with transaction() as conn:
+        conn.executemany('''INSERT INTO customers
+                            (id, name, display_name, phone_number, balance, created_at, updated_at, sync_status)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, 'pending')''',
+                         ((cid, f"customer {i:06d}", f"Customer {i:06d}",
+                           f"09{rng.randrange(10 ** 9):09d}" if i % 3 else None, balances[cid], now, now)
+                          for i, cid in enumerate(ids)))
+    return ids
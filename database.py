@@ -0,0 +1,157 @@
+import sqlite3
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Number of prepared statements each connection keeps around for re-use
+STATEMENT_CACHE_SIZE = 256
+
+# Storage profile applied to every new connection. WAL lets the UI keep reading
+# while sync writes, and NORMAL sync is still crash-safe in WAL mode.
+STORAGE_PROFILE = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -8192,  # negative = KiB, so 8 MB of page cache
+    'mmap_size': 64 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+# How long SQLite itself waits on a locked database before giving up
+BUSY_TIMEOUT = 5.0
+
+# Extra attempts to take the write lock after the busy timeout expired
+LOCK_RETRIES = 4
+LOCK_RETRY_BACKOFF = 0.05
+
+
+# --------------------------
+# Paths
+# --------------------------
+def get_app_dir():
+    """Folder the app runs from (next to the executable when frozen)."""
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    try:
+        return os.path.dirname(os.path.abspath(__file__))
+    except NameError:
+        return os.getcwd()
+
+
+def get_data_dir():
+    data_dir = os.path.join(get_app_dir(), 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    return data_dir
+
+
+DB_PATH = os.path.join(get_data_dir(), 'utracker.db')
+
+_local = threading.local()
+
+
+def configure(db_path):
+    """Point every thread at another database file (used by benchmarks and tools).
+
+    Each thread re-opens its connection lazily on its next call to get_connection().
+    """
+    global DB_PATH
+    DB_PATH = db_path
+
+
+# --------------------------
+# Per-thread connection
+# --------------------------
+def _open_connection(db_path):
+    # isolation_level=None leaves transaction control to transaction() below
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    apply_storage_profile(conn)
+    return conn
+
+
+def apply_storage_profile(conn, profile=None):
+    """Apply the journal/cache pragmas of a storage profile to a connection."""
+    for pragma, value in (profile or STORAGE_PROFILE).items():
+        conn.execute(f'PRAGMA {pragma} = {value}')
+
+
+def get_connection():
+    """Return this thread's long-lived connection, opening it on first use.
+
+    Callers must not close it; use close_connection() when a worker thread exits.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.path != DB_PATH:
+        close_connection()
+        conn = None
+    if conn is None:
+        conn = _open_connection(DB_PATH)
+        _local.conn = conn
+        _local.path = DB_PATH
+        _local.depth = 0
+    return conn
+
+
+def close_connection():
+    """Close this thread's connection, if it has one."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        return
+    try:
+        conn.close()
+    finally:
+        _local.conn = None
+        _local.depth = 0
+
+
+def is_locked_error(error):
+    return isinstance(error, sqlite3.OperationalError) and (
+        'locked' in str(error) or 'busy' in str(error))
+
+
+def with_lock_retry(operation, retries=None, backoff=None):
+    """Run operation(), retrying with jittered exponential backoff while the database is locked."""
+    retries = LOCK_RETRIES if retries is None else retries
+    delay = LOCK_RETRY_BACKOFF if backoff is None else backoff
+    for attempt in range(retries + 1):
+        try:
+            return operation()
+        except sqlite3.OperationalError as e:
+            if not is_locked_error(e) or attempt == retries:
+                raise
+            print(f"Database locked, retrying in {delay:.2f}s ({attempt + 1}/{retries})")
+            time.sleep(delay * (1 + random.random()))
+            delay *= 2
+
+
+@contextmanager
+def transaction():
+    """Unit of work on this thread's connection.
+
+    The outermost block takes the write lock up front (BEGIN IMMEDIATE, retried
+    while locked), so it never fails half-way on a lock upgrade. Nested blocks
+    join it; it commits on success and rolls back if an exception escapes.
+    """
+    conn = get_connection()
+    outermost = _local.depth == 0
+    if outermost:
+        with_lock_retry(lambda: conn.execute('BEGIN IMMEDIATE'))
+    _local.depth += 1
+    try:
+        yield conn
+    except BaseException:
+        _local.depth -= 1
+        if outermost and conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    else:
+        _local.depth -= 1
+        if outermost:
+            try:
+                conn.execute('COMMIT')
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
@@ -0,0 +1,288 @@
+"""Ledger queries shared by the desktop (Tk) and mobile (Kivy) apps."""
+import calendar
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from database import get_connection, transaction
+from schema import CREDIT_ACTIONS_SQL
+from search import search_customer_ids
+
+# A customer is overdue once their oldest open credit is older than this
+OVERDUE_DAYS = 30
+
+# Actions that raise what a customer owes; "Paid" lowers it
+DEBIT_ACTIONS = ('Credit Added', 'Add Credit', 'Overdue Penalty')
+PAYMENT_ACTION = 'Paid'
+
+# Rows per keyset page of the dashboard
+DASHBOARD_PAGE_SIZE = 200
+
+# Rows per keyset page of a customer's ledger
+LEDGER_PAGE_SIZE = 200
+
+# Monthly late fee added to overdue accounts
+PENALTY_AMOUNT = 3.0
+PENALTY_INTERVAL_DAYS = 30
+
+# Balances that differ by less than this are treated as equal by the repair check
+BALANCE_TOLERANCE = 0.005
+
+
+def overdue_cutoff(now=None):
+    return ((now or datetime.now()) - timedelta(days=OVERDUE_DAYS)).isoformat()
+
+
+def occurred_at(date, time):
+    """Sort key stored in transactions.occurred_at (see schema._occurred_at).
+
+    Unparseable dates get 0, so those rows sort as the oldest and never break a keyset cursor.
+    """
+    try:
+        return calendar.timegm(datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M").timetuple())
+    except (TypeError, ValueError):
+        return 0
+
+
+def format_last_transaction(date, time):
+    if not date:
+        return "N/A"
+    try:
+        return datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M").strftime("%Y-%m-%d %I:%M %p")
+    except (TypeError, ValueError):
+        return f"{date} {time}"
+
+
+_DASHBOARD_SQL = '''
+    SELECT c.id, c.display_name, c.balance, s.last_tx_date, s.last_tx_time,
+           c.balance > 0 AND s.oldest_credit_at < ?
+    FROM customers c LEFT JOIN customer_summary s ON s.customer_id = c.id'''
+
+
+def _dashboard_rows(sql, params):
+    return [(cid, display_name, balance, format_last_transaction(date, time), bool(is_overdue))
+            for cid, display_name, balance, date, time, is_overdue in get_connection().execute(sql, params)]
+
+
+def get_dashboard_rows(search_term=None):
+    """Customers shown on the dashboards, read from customer_summary in a single query.
+
+    Returns (customer_id, display_name, balance, last_transaction, is_overdue) tuples,
+    ordered by display name, or best match first when searching (see search.py).
+    """
+    if not search_term:
+        return _dashboard_rows(_DASHBOARD_SQL + ' WHERE c.balance >= 0 ORDER BY c.display_name, c.id',
+                               [overdue_cutoff()])
+    ids = search_customer_ids(search_term)
+    if not ids:
+        return []
+    rows = _dashboard_rows(_DASHBOARD_SQL + f" WHERE c.id IN ({','.join('?' * len(ids))})",
+                           [overdue_cutoff()] + ids)
+    order = {cid: position for position, cid in enumerate(ids)}
+    rows.sort(key=lambda row: order[row[0]])
+    return rows
+
+
+def get_dashboard_page(after=None, limit=DASHBOARD_PAGE_SIZE):
+    """One page of the unfiltered dashboard, in (display_name, id) order.
+
+    after is the cursor returned with the previous page (None for the first).
+    Returns (rows, next_after); next_after is None once the last page is reached.
+    """
+    sql = _DASHBOARD_SQL + ' WHERE c.balance >= 0'
+    params = [overdue_cutoff()]
+    if after is not None:
+        sql += ' AND (c.display_name, c.id) > (?, ?)'
+        params += list(after)
+    rows = _dashboard_rows(sql + ' ORDER BY c.display_name, c.id LIMIT ?', params + [limit])
+    next_after = (rows[-1][1], rows[-1][0]) if len(rows) == limit else None
+    return rows, next_after
+
+
+# --------------------------
+# Ledger history
+# --------------------------
+LedgerRow = namedtuple('LedgerRow', [
+    'id', 'date', 'time', 'action', 'product', 'quantity', 'amount', 'actual_borrower', 'is_deleted', 'occurred_at'])
+
+
+def get_ledger_page(customer_id, after=None, limit=LEDGER_PAGE_SIZE, newest_first=False, actions=None,
+                    include_deleted=False):
+    """One page of a customer's ledger in (occurred_at, id) order, read off idx_tx_customer_ledger.
+
+    after is the cursor returned with the previous page (None for the first);
+    newest_first walks the ledger backwards. actions limits the page to those
+    action names, and deleted rows are skipped unless include_deleted is set.
+    Returns (rows, next_after) with LedgerRow rows; next_after is None once
+    the last page is reached.
+    """
+    sql = f"SELECT {', '.join(LedgerRow._fields)} FROM transactions WHERE customer_id = ?"
+    params = [customer_id]
+    if not include_deleted:
+        sql += ' AND is_deleted = 0'
+    if actions:
+        sql += f" AND action IN ({','.join('?' * len(actions))})"
+        params += list(actions)
+    direction, compare = ('DESC', '<') if newest_first else ('ASC', '>')
+    if after is not None:
+        sql += f' AND (occurred_at, id) {compare} (?, ?)'
+        params += list(after)
+    sql += f' ORDER BY occurred_at {direction}, id {direction} LIMIT ?'
+    rows = [LedgerRow(*row) for row in get_connection().execute(sql, params + [limit])]
+    next_after = (rows[-1].occurred_at, rows[-1].id) if len(rows) == limit else None
+    return rows, next_after
+
+
+def iter_ledger(customer_id, page_size=LEDGER_PAGE_SIZE, **filters):
+    """Yield every matching LedgerRow page by page, for exports that must not load the whole ledger.
+
+    Takes the same filters as get_ledger_page().
+    """
+    after = None
+    while True:
+        rows, after = get_ledger_page(customer_id, after, page_size, **filters)
+        yield from rows
+        if after is None:
+            return
+
+
+# --------------------------
+# Balances
+# --------------------------
+def balance_effect(action, amount):
+    """How much a ledger row adds to the customer's balance."""
+    if action in DEBIT_ACTIONS:
+        return amount
+    if action == PAYMENT_ACTION:
+        return -amount
+    return 0
+
+
+def apply_balance_delta(conn, customer_id, delta, now=None):
+    """Adjust a balance by delta inside the caller's transaction and return the new balance.
+
+    Call it after the ledger row is written. Customers marked removed (balance -1)
+    have no running total to adjust, so they are recomputed from their ledger.
+    """
+    now = now or datetime.now().isoformat()
+    cursor = conn.execute(
+        "UPDATE customers SET balance = balance + ?, updated_at = ?, sync_status = 'pending' "
+        "WHERE id = ? AND balance >= 0",
+        (delta, now, customer_id))
+    if cursor.rowcount == 0:
+        balance = ledger_balance(conn, customer_id)
+        conn.execute("UPDATE customers SET balance = ?, updated_at = ?, sync_status = 'pending' WHERE id = ?",
+                     (balance, now, customer_id))
+        return balance
+    return conn.execute('SELECT balance FROM customers WHERE id = ?', (customer_id,)).fetchone()[0]
+
+
+_LEDGER_BALANCE_SQL = f'''
+    SELECT c.id, c.balance,
+           COALESCE((SELECT SUM(CASE WHEN t.action IN {CREDIT_ACTIONS_SQL} OR t.action = 'Overdue Penalty'
+                                     THEN t.amount
+                                     WHEN t.action = 'Paid' THEN -t.amount
+                                     ELSE 0 END)
+                     FROM transactions t WHERE t.customer_id = c.id AND t.is_deleted = 0), 0)
+    FROM customers c'''
+
+
+def ledger_balance(conn, customer_id):
+    """Balance implied by a customer's non-deleted ledger rows (None if the customer is unknown)."""
+    row = conn.execute(_LEDGER_BALANCE_SQL + ' WHERE c.id = ?', (customer_id,)).fetchone()
+    return row[2] if row else None
+
+
+def repair_balances(customer_ids=None, fix=True):
+    """Recompute balances from the full ledger and correct any that drifted.
+
+    This is the explicit repair path; everyday writes use apply_balance_delta().
+    A full run skips customers marked removed (balance -1). Returns
+    {customer_id: ledger_balance} for every customer whose stored balance did
+    not match; those are rewritten when fix is True.
+    """
+    with transaction() as conn:
+        if customer_ids is None:
+            rows = conn.execute(_LEDGER_BALANCE_SQL + ' WHERE c.balance >= 0').fetchall()
+        else:
+            rows = []
+            for customer_id in customer_ids:
+                rows += conn.execute(_LEDGER_BALANCE_SQL + ' WHERE c.id = ?', (customer_id,)).fetchall()
+
+        drifted = {customer_id: computed for customer_id, stored, computed in rows
+                   if abs(stored - computed) >= BALANCE_TOLERANCE}
+        if drifted and fix:
+            now = datetime.now().isoformat()
+            conn.executemany("UPDATE customers SET balance = ?, updated_at = ?, sync_status = 'pending' WHERE id = ?",
+                             [(balance, now, customer_id) for customer_id, balance in drifted.items()])
+    if drifted:
+        print(f"Balance repair: {len(drifted)} customer(s) did not match their ledger")
+    return drifted
+
+
+# --------------------------
+# Overdue accounts and penalties
+# --------------------------
+OverdueAccount = namedtuple('OverdueAccount', [
+    'customer_id', 'name', 'old_balance', 'new_balance', 'penalty_added', 'days_since_penalty', 'penalty_id'])
+
+_OVERDUE_SQL = '''
+    SELECT c.id, c.display_name, c.balance,
+           CAST(julianday(?) - julianday(MAX(t.date)) AS INTEGER)
+    FROM customers c
+    JOIN customer_summary s ON s.customer_id = c.id
+    LEFT JOIN transactions t ON t.customer_id = c.id AND t.action = 'Overdue Penalty' AND t.is_deleted = 0
+    WHERE c.balance > 0 AND s.oldest_credit_at < ?
+    GROUP BY c.id
+    ORDER BY c.display_name'''
+
+
+def apply_overdue_penalties(now=None):
+    """Find every overdue account and add the monthly penalty where one is due.
+
+    One aggregate query finds the overdue customers and their last penalty, and
+    all new penalty rows are written in a single transaction. Returns a list of
+    OverdueAccount; days_since_penalty is None when a penalty was never added,
+    and penalty_id is the new penalty row's id (None when none was due).
+    """
+    now = now or datetime.now()
+    now_iso = now.isoformat()
+    today, time = now.strftime("%Y-%m-%d"), now.strftime("%H:%M")
+    stamp = occurred_at(today, time)
+    accounts, penalties = [], []
+
+    with transaction() as conn:
+        rows = conn.execute(_OVERDUE_SQL, (now_iso, overdue_cutoff(now))).fetchall()
+        for customer_id, name, balance, days_since_penalty in rows:
+            due = days_since_penalty is None or days_since_penalty >= PENALTY_INTERVAL_DAYS
+            penalty_id = str(uuid.uuid4()) if due else None
+            if due:
+                penalties.append((penalty_id, customer_id, today, time, stamp, "Overdue Penalty", "Late Fee",
+                                  1, PENALTY_AMOUNT, now_iso, now_iso, 'pending'))
+            accounts.append(OverdueAccount(customer_id, name, balance, balance + PENALTY_AMOUNT if due else balance,
+                                           due, days_since_penalty, penalty_id))
+        if penalties:
+            conn.executemany('''INSERT INTO transactions
+                                (id, customer_id, date, time, occurred_at, action, product, quantity, amount,
+                                 created_at, updated_at, sync_status, is_deleted)
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)''', penalties)
+            conn.executemany("UPDATE customers SET balance = balance + ?, updated_at = ?, sync_status = 'pending' "
+                             "WHERE id = ?",
+                             [(PENALTY_AMOUNT, now_iso, row[1]) for row in penalties])
+
+    print(f"Overdue check: {len(accounts)} overdue, {len(penalties)} penalties added")
+    return accounts
+
+
+if __name__ == '__main__':
+    # Maintenance entry point: `python ledger.py` reports drift, `python ledger.py --fix` repairs it
+    import sys
+
+    import schema
+
+    schema.upgrade()
+    drifted = repair_balances(fix='--fix' in sys.argv)
+    for customer_id, balance in drifted.items():
+        print(f"{customer_id}: ledger balance {balance:.2f}")
+    if not drifted:
+        print("All balances match their ledger.")
@@ -0,0 +1,413 @@
+"""Versioned schema upgrades shared by the desktop app, the mobile app and sync.
+
+Each migration runs once, in order, inside the same transaction that bumps
+PRAGMA user_version, so a database is always at a known version.
+"""
+import sqlite3
+import uuid
+from datetime import datetime
+
+from database import transaction
+
+CREDIT_ACTIONS_SQL = "('Credit Added', 'Add Credit')"
+
+
+def _legacy_tables(conn):
+    """Rebuild tables from before sync: integer ids become UUIDs, and sync fields are added.
+
+    Older files of either app used INTEGER ids or had no sync_status; their
+    rows are copied into the current tables (created by the caller) and
+    count as synced, as the apps' own one-off migrations treated them.
+    Returns whether old tables were set aside as customers_old and
+    transactions_old for _copy_legacy_rows().
+    """
+    columns = {col[1]: col[2] for col in conn.execute("PRAGMA table_info(customers)")}
+    if not columns or ('sync_status' in columns and columns.get('id') != 'INTEGER'):
+        return False
+    print("Migrating database to new schema...")
+    conn.execute("ALTER TABLE customers RENAME TO customers_old")
+    conn.execute("ALTER TABLE transactions RENAME TO transactions_old")
+    return True
+
+
+def _copy_legacy_rows(conn):
+    now = datetime.now().isoformat()
+    new_ids = {}
+    for old_id, name, display_name, phone_number, balance in conn.execute(
+            'SELECT id, name, display_name, phone_number, balance FROM customers_old').fetchall():
+        new_ids[old_id] = str(uuid.uuid4()) if isinstance(old_id, int) else old_id
+        conn.execute('''INSERT INTO customers
+                        (id, name, display_name, phone_number, balance, created_at, updated_at, sync_status)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, 'synced')''',
+                     (new_ids[old_id], name, display_name, phone_number, balance, now, now))
+    rows = conn.execute('''SELECT id, customer_id, date, time, action, product, quantity, amount, actual_borrower
+                          FROM transactions_old''').fetchall()
+    conn.executemany('''INSERT INTO transactions
+                        (id, customer_id, date, time, action, product, quantity, amount, actual_borrower,
+                         created_at, updated_at, sync_status)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'synced')''',
+                     [(str(uuid.uuid4()) if isinstance(tx_id, int) else tx_id, new_ids.get(customer_id, customer_id),
+                       *rest, now, now) for tx_id, customer_id, *rest in rows])
+    conn.execute("DROP TABLE customers_old")
+    conn.execute("DROP TABLE transactions_old")
+
+
+def _base_tables(conn):
+    """Tables and indexes both apps expect, including the is_deleted flag older files lack."""
+    legacy = _legacy_tables(conn)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS customers (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            display_name TEXT NOT NULL,
+            phone_number TEXT,
+            balance REAL NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            sync_status TEXT DEFAULT 'pending',
+            firebase_id TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id TEXT PRIMARY KEY,
+            customer_id TEXT NOT NULL,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            action TEXT NOT NULL,
+            product TEXT,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            amount REAL NOT NULL,
+            actual_borrower TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            sync_status TEXT DEFAULT 'pending',
+            firebase_id TEXT,
+            is_deleted INTEGER DEFAULT 0,
+            FOREIGN KEY (customer_id) REFERENCES customers (id)
+        )
+    ''')
+    columns = [col[1] for col in conn.execute("PRAGMA table_info(transactions)").fetchall()]
+    if 'is_deleted' not in columns:
+        conn.execute("ALTER TABLE transactions ADD COLUMN is_deleted INTEGER DEFAULT 0")
+    if legacy:
+        _copy_legacy_rows(conn)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_customer_name ON customers (name)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sync_status ON customers (sync_status)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_tx_sync_status ON transactions (sync_status)')
+
+
+# Recomputes one customer's summary row from index seeks only
+_REFRESH_SUMMARY = f'''
+    INSERT OR REPLACE INTO customer_summary (customer_id, last_tx_date, last_tx_time, oldest_credit_at)
+    VALUES ({{cid}},
+        (SELECT date FROM transactions WHERE customer_id = {{cid}} AND is_deleted = 0
+         ORDER BY date DESC, time DESC LIMIT 1),
+        (SELECT time FROM transactions WHERE customer_id = {{cid}} AND is_deleted = 0
+         ORDER BY date DESC, time DESC LIMIT 1),
+        (SELECT MIN(created_at) FROM transactions WHERE customer_id = {{cid}} AND is_deleted = 0
+         AND action IN {CREDIT_ACTIONS_SQL}));
+'''
+
+
+def _customer_summary(conn):
+    """Read model behind the dashboards, kept current by triggers on the ledger.
+
+    The balance stays on customers (joined by primary key); the overdue flag is
+    derived from oldest_credit_at at read time because it depends on the clock.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS customer_summary (
+            customer_id TEXT PRIMARY KEY,
+            last_tx_date TEXT,
+            last_tx_time TEXT,
+            oldest_credit_at TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_tx_customer_recent '
+                 'ON transactions (customer_id, is_deleted, date, time)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_tx_customer_action '
+                 'ON transactions (customer_id, action, is_deleted, created_at)')
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_summary_customer_insert AFTER INSERT ON customers
+        BEGIN
+            INSERT OR IGNORE INTO customer_summary (customer_id) VALUES (NEW.id);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_summary_customer_delete AFTER DELETE ON customers
+        BEGIN
+            DELETE FROM customer_summary WHERE customer_id = OLD.id;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_summary_tx_insert AFTER INSERT ON transactions
+        BEGIN
+            {_REFRESH_SUMMARY.format(cid='NEW.customer_id')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_summary_tx_update
+        AFTER UPDATE OF customer_id, date, time, action, created_at, is_deleted ON transactions
+        BEGIN
+            {_REFRESH_SUMMARY.format(cid='NEW.customer_id')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_summary_tx_move AFTER UPDATE OF customer_id ON transactions
+        WHEN OLD.customer_id != NEW.customer_id
+        BEGIN
+            {_REFRESH_SUMMARY.format(cid='OLD.customer_id')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_summary_tx_delete AFTER DELETE ON transactions
+        BEGIN
+            {_REFRESH_SUMMARY.format(cid='OLD.customer_id')}
+        END
+    ''')
+
+    # Backfill from the existing ledger in one pass
+    conn.execute('DELETE FROM customer_summary')
+    conn.execute(f'''
+        INSERT INTO customer_summary (customer_id, last_tx_date, last_tx_time, oldest_credit_at)
+        SELECT c.id,
+               (SELECT date FROM transactions WHERE customer_id = c.id AND is_deleted = 0
+                ORDER BY date DESC, time DESC LIMIT 1),
+               (SELECT time FROM transactions WHERE customer_id = c.id AND is_deleted = 0
+                ORDER BY date DESC, time DESC LIMIT 1),
+               (SELECT MIN(created_at) FROM transactions WHERE customer_id = c.id AND is_deleted = 0
+                AND action IN {CREDIT_ACTIONS_SQL})
+        FROM customers c
+    ''')
+
+
+def _occurred_at(conn):
+    """Integer sort key for the ledger so history pages read straight off an index.
+
+    occurred_at is the row's local date and time as seconds since the epoch,
+    read as if it were UTC, so it keeps wall-clock order across DST changes.
+    """
+    columns = [col[1] for col in conn.execute("PRAGMA table_info(transactions)").fetchall()]
+    if 'occurred_at' not in columns:
+        conn.execute("ALTER TABLE transactions ADD COLUMN occurred_at INTEGER")
+    conn.execute("UPDATE transactions SET occurred_at = CAST(strftime('%s', date || ' ' || time) AS INTEGER)")
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_tx_customer_occurred '
+                 'ON transactions (customer_id, is_deleted, occurred_at)')
+
+
+def _customer_search(conn):
+    """FTS5 trigram index over customer names, kept in step with customers by triggers.
+
+    SQLite builds without FTS5 or the trigram tokenizer skip it, and search
+    falls back to LIKE. Superseded by _customer_search_by_id().
+    """
+    try:
+        conn.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS customer_search
+                        USING fts5(name, content='customers', content_rowid='rowid', tokenize='trigram')""")
+    except sqlite3.OperationalError as e:
+        print(f"Full-text customer search unavailable ({e}); using LIKE search")
+        return
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_search_customer_insert AFTER INSERT ON customers
+        BEGIN
+            INSERT INTO customer_search (rowid, name) VALUES (NEW.rowid, NEW.name);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_search_customer_delete AFTER DELETE ON customers
+        BEGIN
+            INSERT INTO customer_search (customer_search, rowid, name) VALUES ('delete', OLD.rowid, OLD.name);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_search_customer_update AFTER UPDATE OF name ON customers
+        BEGIN
+            INSERT INTO customer_search (customer_search, rowid, name) VALUES ('delete', OLD.rowid, OLD.name);
+            INSERT INTO customer_search (rowid, name) VALUES (NEW.rowid, NEW.name);
+        END
+    ''')
+    conn.execute("INSERT INTO customer_search (customer_search) VALUES ('rebuild')")
+
+
+def _dashboard_order(conn):
+    """Index that serves the dashboard's (display_name, id) keyset pages of active customers."""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_customer_dashboard '
+                 'ON customers (display_name, id) WHERE balance >= 0')
+
+
+def _ledger_order(conn):
+    """Index that serves keyset pages of one customer's ledger in either direction.
+
+    Rows without a parseable date get occurred_at 0 so a (occurred_at, id)
+    cursor never meets a NULL; the old history index is superseded.
+    """
+    conn.execute('UPDATE transactions SET occurred_at = 0 WHERE occurred_at IS NULL')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_tx_customer_ledger '
+                 'ON transactions (customer_id, occurred_at, id)')
+    conn.execute('DROP INDEX IF EXISTS idx_tx_customer_occurred')
+
+
+def _sync_state(conn):
+    """Per-collection high-water marks of the delta pull (see sync_state.py)."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            collection TEXT PRIMARY KEY,
+            watermark TEXT
+        )
+    ''')
+
+
+def _firebase_ids(conn):
+    """Indexes for resolving pulled documents to local rows by firebase_id."""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_customer_firebase ON customers (firebase_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_tx_firebase ON transactions (firebase_id)')
+
+
+# Local time in the same ISO form the apps write with datetime.now().isoformat()
+_NOW_SQL = "strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')"
+
+_CUSTOMER_SYNCED_COLUMNS = 'name, display_name, phone_number, balance'
+_TRANSACTION_SYNCED_COLUMNS = ('customer_id, date, time, occurred_at, action, product, quantity, amount, '
+                               'actual_borrower, is_deleted')
+
+
+def _outbox_triggers(conn, table, columns):
+    """Queue every local change to table in sync_outbox.
+
+    Pulled rows arrive as 'synced' with the remote updated_at, so they are not
+    queued. A write that changes synced columns without stamping updated_at
+    (older desktop paths) is stamped here so the change still wins remotely.
+    """
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_outbox_{table}_insert AFTER INSERT ON {table}
+        WHEN NEW.sync_status IS NOT 'synced'
+        BEGIN
+            INSERT INTO sync_outbox (table_name, row_id) VALUES ('{table}', NEW.id);
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_outbox_{table}_update AFTER UPDATE OF {columns} ON {table}
+        WHEN NEW.updated_at IS NOT OLD.updated_at AND NEW.sync_status IS NOT 'synced'
+        BEGIN
+            INSERT INTO sync_outbox (table_name, row_id) VALUES ('{table}', NEW.id);
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_outbox_{table}_stamp AFTER UPDATE OF {columns} ON {table}
+        WHEN NEW.updated_at IS OLD.updated_at
+        BEGIN
+            UPDATE {table} SET updated_at = {_NOW_SQL}, sync_status = 'pending' WHERE id = NEW.id;
+            INSERT INTO sync_outbox (table_name, row_id) VALUES ('{table}', NEW.id);
+        END
+    ''')
+
+
+def _sync_outbox(conn):
+    """Append-only change log the sync engine pushes from, in seq order.
+
+    Entries are deleted once the cloud has acknowledged them (see sync_state.py).
+    A deleted transaction that was already in the cloud leaves its firebase_id
+    behind, so the push can mark that document deleted.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sync_outbox (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id TEXT NOT NULL,
+            deleted_firebase_id TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_outbox_row ON sync_outbox (table_name, row_id)')
+    _outbox_triggers(conn, 'customers', _CUSTOMER_SYNCED_COLUMNS)
+    _outbox_triggers(conn, 'transactions', _TRANSACTION_SYNCED_COLUMNS)
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_outbox_transactions_delete AFTER DELETE ON transactions
+        WHEN OLD.firebase_id IS NOT NULL
+        BEGIN
+            INSERT INTO sync_outbox (table_name, row_id, deleted_firebase_id)
+            VALUES ('transactions', OLD.id, OLD.firebase_id);
+        END
+    ''')
+
+    # Queue whatever the old sync_status scan would still have pushed
+    for table in ('customers', 'transactions'):
+        conn.execute(f"""INSERT INTO sync_outbox (table_name, row_id)
+                         SELECT '{table}', id FROM {table} WHERE sync_status = 'pending' OR firebase_id IS NULL""")
+
+
+# Drops a customer's entry from the id-keyed search index. A phrase match on the
+# old name narrows the rows first, since id is unindexed; names shorter than a
+# trigram cannot match, and fall back to checking every row.
+_SEARCH_DELETE = """
+    DELETE FROM customer_search WHERE rowid IN (
+        SELECT rowid FROM customer_search
+        WHERE customer_search MATCH '"' || replace(OLD.name, '"', '""') || '"' AND id = OLD.id
+        UNION ALL
+        SELECT rowid FROM customer_search WHERE length(OLD.name) < 3 AND id = OLD.id
+    );"""
+
+
+def _customer_search_by_id(conn):
+    """Re-key the customer search index on customers.id instead of the implicit rowid.
+
+    A VACUUM may renumber the rowids of a table with a TEXT primary key, which
+    silently pointed the external-content index at the wrong customers. The
+    index is now an ordinary FTS5 table holding its own copy of each name next
+    to an unindexed id, so nothing depends on the rowid.
+    """
+    for trigger in ('trg_search_customer_insert', 'trg_search_customer_delete', 'trg_search_customer_update'):
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    conn.execute('DROP TABLE IF EXISTS customer_search')
+    try:
+        conn.execute("""CREATE VIRTUAL TABLE customer_search
+                        USING fts5(id UNINDEXED, name, tokenize='trigram')""")
+    except sqlite3.OperationalError as e:
+        print(f"Full-text customer search unavailable ({e}); using LIKE search")
+        return
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_search_customer_insert AFTER INSERT ON customers
+        BEGIN
+            INSERT INTO customer_search (id, name) VALUES (NEW.id, NEW.name);
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_search_customer_delete AFTER DELETE ON customers
+        BEGIN
+            {_SEARCH_DELETE}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_search_customer_update AFTER UPDATE OF id, name ON customers
+        BEGIN
+            {_SEARCH_DELETE}
+            INSERT INTO customer_search (id, name) VALUES (NEW.id, NEW.name);
+        END
+    ''')
+    conn.execute('INSERT INTO customer_search (id, name) SELECT id, name FROM customers')
+
+
+MIGRATIONS = [
+    _base_tables,
+    _customer_summary,
+    _occurred_at,
+    _customer_search,
+    _dashboard_order,
+    _ledger_order,
+    _sync_state,
+    _firebase_ids,
+    _sync_outbox,
+    _customer_search_by_id,
+]
+
+
+def upgrade():
+    """Bring the database up to the latest schema version."""
+    with transaction() as conn:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS, 1):
+            if number > version:
+                print(f"Applying schema migration {number}: {migration.__name__.strip('_')}")
+                migration(conn)
+                conn.execute(f'PRAGMA user_version = {number}')
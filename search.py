@@ -0,0 +1,229 @@
+"""Customer search shared by the desktop and mobile dashboards."""
+import bisect
+import queue
+import threading
+import traceback
+
+from database import get_connection
+
+# Most customers a dashboard search returns
+SEARCH_LIMIT = 100
+
+# The trigram index can only answer terms of at least this many characters
+MIN_FTS_TERM = 3
+
+
+def has_fts_index(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'customer_search'").fetchone() is not None
+
+
+def search_customer_ids(term, limit=SEARCH_LIMIT):
+    """Ids of active customers whose name contains term, best match first.
+
+    Uses the FTS5 trigram index (ranked by bm25) when it exists and the term is
+    long enough; otherwise a LIKE scan ranked by where the term appears.
+    """
+    term = (term or '').strip().lower()
+    if not term:
+        return []
+    conn = get_connection()
+    if len(term) >= MIN_FTS_TERM and has_fts_index(conn):
+        rows = conn.execute('''SELECT c.id FROM customer_search s JOIN customers c ON c.id = s.id
+                               WHERE customer_search MATCH ? AND c.balance >= 0
+                               ORDER BY s.rank LIMIT ?''',
+                            ('"' + term.replace('"', '""') + '"', limit)).fetchall()
+    else:
+        like = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        rows = conn.execute('''SELECT id FROM customers
+                               WHERE name LIKE ? ESCAPE '\\' AND balance >= 0
+                               ORDER BY instr(name, ?), display_name LIMIT ?''',
+                            (like, term, limit)).fetchall()
+    return [row[0] for row in rows]
+
+
+class NameIndex:
+    """In-memory index of borrower names for type-ahead suggestions.
+
+    Names are casefolded once when added. A prefix trie gives prefix hits in
+    alphabetical order, and every 1-3 character gram keeps a sorted list of
+    the names containing it, so substring hits also come out in order and a
+    lookup stops as soon as it has enough.
+    """
+    GRAM_SIZE = 3
+
+    def __init__(self, names=()):
+        self.reset(names)
+
+    def reset(self, names):
+        self._keys = {}  # display name -> casefolded name
+        self._trie = {}  # char -> child node; '' -> set of display names ending here
+        self._grams = {}  # gram -> sorted [(casefolded name, display name)]
+        for name in names:
+            self._add(name, sort=False)
+        for entries in self._grams.values():
+            entries.sort()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, name):
+        return name in self._keys
+
+    def _grams_of(self, key):
+        return {key[start:start + size]
+                for size in range(1, self.GRAM_SIZE + 1)
+                for start in range(len(key) - size + 1)}
+
+    def add(self, name):
+        self._add(name, sort=True)
+
+    def _add(self, name, sort):
+        if not name or name in self._keys:
+            return
+        key = name.casefold()
+        self._keys[name] = key
+        node = self._trie
+        for char in key:
+            node = node.setdefault(char, {})
+        node.setdefault('', set()).add(name)
+        for gram in self._grams_of(key):
+            entries = self._grams.setdefault(gram, [])
+            if sort:
+                bisect.insort(entries, (key, name))
+            else:
+                entries.append((key, name))
+
+    def remove(self, name):
+        key = self._keys.pop(name, None)
+        if key is None:
+            return
+        path = [self._trie]
+        for char in key:
+            path.append(path[-1][char])
+        path[-1][''].discard(name)
+        # Prune nodes left empty, deepest first
+        for depth in range(len(key), 0, -1):
+            node = path[depth]
+            if node.get('') == set():
+                del node['']
+            if node:
+                break
+            del path[depth - 1][key[depth - 1]]
+        for gram in self._grams_of(key):
+            entries = self._grams[gram]
+            del entries[bisect.bisect_left(entries, (key, name))]
+            if not entries:
+                del self._grams[gram]
+
+    def rename(self, old_name, new_name):
+        self.remove(old_name)
+        self.add(new_name)
+
+    def search(self, text, limit=8):
+        """Up to `limit` names containing text: prefix matches first, then other substring matches."""
+        term = (text or '').casefold()
+        if not term:
+            return []
+        hits = self._prefix_hits(term, limit)
+        if len(hits) < limit:
+            seen = set(hits)
+            for key, name in self._substring_candidates(term):
+                if name not in seen and term in key:
+                    hits.append(name)
+                    if len(hits) == limit:
+                        break
+        return hits
+
+    def _prefix_hits(self, term, limit):
+        node = self._trie
+        for char in term:
+            node = node.get(char)
+            if node is None:
+                return []
+        hits = []
+        stack = [node]
+        # Depth-first in character order, so hits come out alphabetically
+        while stack and len(hits) < limit:
+            node = stack.pop()
+            hits.extend(sorted(node.get('', ())))
+            stack.extend(node[char] for char in sorted((c for c in node if c), reverse=True))
+        return hits[:limit]
+
+    def _substring_candidates(self, term):
+        """Sorted entries of the rarest gram in term; every substring hit is among them."""
+        grams = [term[i:i + self.GRAM_SIZE] for i in range(max(1, len(term) - self.GRAM_SIZE + 1))]
+        return min((self._grams.get(gram, []) for gram in grams), key=len)
+
+
+class SearchController:
+    """Debounced, latest-wins search for a dashboard search box.
+
+    submit() is called on every keystroke. Keystrokes inside the debounce
+    window are coalesced; the query runs on a worker thread, and its result is
+    applied only if no newer input arrived meanwhile. The UI toolkit is plugged
+    in through three callables:
+
+        schedule(delay_seconds, callback) -> handle, and cancel(handle), for the timer
+        post(callback), to run a callback on the UI thread (safe from any thread)
+    """
+    DEBOUNCE_SECONDS = 0.25
+
+    def __init__(self, query, apply, schedule, cancel, post, delay=None):
+        self.query = query
+        self.apply = apply
+        self._schedule = schedule
+        self._cancel = cancel
+        self._post = post
+        self.delay = self.DEBOUNCE_SECONDS if delay is None else delay
+        self._generation = 0
+        self._timer = None
+        self._requests = queue.Queue(maxsize=1)
+        self._worker = None
+
+    def submit(self, text):
+        """Queue a search for text, superseding anything not yet applied. UI thread only."""
+        self._generation += 1
+        generation = self._generation
+        self._cancel_timer()
+        self._timer = self._schedule(self.delay, lambda *_: self._dispatch(generation, text))
+
+    def cancel(self):
+        """Drop any pending or in-flight search. UI thread only."""
+        self._generation += 1
+        self._cancel_timer()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._cancel(self._timer)
+            self._timer = None
+
+    def _dispatch(self, generation, text):
+        self._timer = None
+        if generation != self._generation:
+            return
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name='search-worker', daemon=True)
+            self._worker.start()
+        # Keep only the newest request; a waiting older one is already stale
+        try:
+            self._requests.get_nowait()
+        except queue.Empty:
+            pass
+        self._requests.put((generation, text))
+
+    def _run(self):
+        while True:
+            generation, text = self._requests.get()
+            if generation != self._generation:
+                continue
+            try:
+                result = self.query(text)
+            except Exception:
+                traceback.print_exc()
+                continue
+            self._post(lambda *_, g=generation, r=result: self._deliver(g, r))
+
+    def _deliver(self, generation, result):
+        if generation == self._generation:
+            self.apply(result)
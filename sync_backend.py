@@ -0,0 +1,240 @@
+"""Cloud stores the sync code can talk to: Firestore, and an in-process fake for offline runs.
+
+SyncBackend is everything sync_state.py, SnapshotListener and the push code
+need from the cloud. FirestoreBackend adapts a firestore.client(); the
+MemoryBackend keeps documents in dicts and can add latency and inject
+failures, so sync can be benchmarked and exercised without a network.
+"""
+import random
+import threading
+import time
+import uuid
+
+
+class BackendUnavailable(Exception):
+    """A backend call failed the way a network call can; retrying later may succeed."""
+
+
+class SyncBackend:
+    """Document store interface; documents are (doc_id, data) pairs.
+
+    Listener callbacks get [(kind, doc_id, data)], kind being 'ADDED',
+    'MODIFIED' or 'REMOVED', and may run on any thread.
+    """
+
+    def stream(self, collection):
+        """Every document in collection."""
+        raise NotImplementedError
+
+    def query(self, collection, field, after, page_size):
+        """Documents whose field is greater than after, in field order, read page_size at a time."""
+        raise NotImplementedError
+
+    def new_id(self, collection):
+        """A fresh document id, assigned client-side."""
+        raise NotImplementedError
+
+    def batch(self):
+        """A write batch: set(collection, doc_id, data, merge=False), then commit() applies all or none."""
+        raise NotImplementedError
+
+    def listen(self, collection, callback, field=None, after=None):
+        """Call callback with the matching documents, then with each later change to them.
+
+        Matching means every document, or those whose field is greater than
+        after. Returns a handle with unsubscribe() and an is_active attribute.
+        """
+        raise NotImplementedError
+
+
+class FirestoreBackend(SyncBackend):
+    def __init__(self, client):
+        self.client = client
+
+    def stream(self, collection):
+        for doc in self.client.collection(collection).stream():
+            yield doc.id, doc.to_dict()
+
+    def query(self, collection, field, after, page_size):
+        query = self.client.collection(collection).where(field, '>', after).order_by(field).limit(page_size)
+        last = None
+        while True:
+            # Cursor on the last snapshot, so documents sharing a field value are not skipped
+            page = list((query.start_after(last) if last is not None else query).stream())
+            for doc in page:
+                yield doc.id, doc.to_dict()
+            if len(page) < page_size:
+                return
+            last = page[-1]
+
+    def new_id(self, collection):
+        return self.client.collection(collection).document().id
+
+    def batch(self):
+        return _FirestoreBatch(self.client)
+
+    def listen(self, collection, callback, field=None, after=None):
+        query = self.client.collection(collection)
+        if field is not None:
+            query = query.where(field, '>', after)
+        return query.on_snapshot(lambda snapshot, changes, read_time: callback(
+            [(change.type.name, change.document.id, change.document.to_dict()) for change in changes]))
+
+
+class _FirestoreBatch:
+    def __init__(self, client):
+        self.client = client
+        self._batch = client.batch()
+
+    def set(self, collection, doc_id, data, merge=False):
+        self._batch.set(self.client.collection(collection).document(doc_id), data, merge=merge)
+
+    def commit(self):
+        self._batch.commit()
+
+
+class MemoryBackend(SyncBackend):
+    """In-process fake: documents live in dicts and every call can be slowed down or made to fail.
+
+    latency is the seconds one call (a query page, a batch commit) takes.
+    failure_rate is the chance a call raises BackendUnavailable; fail_next(n)
+    makes the next n calls fail. calls counts calls by kind and writes counts
+    committed document writes, for benchmarks. Documents hold plain values,
+    so copies in and out are shallow.
+    """
+
+    # Documents per streamed response, like Firestore's batches; each one costs a call
+    STREAM_PAGE = 500
+
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = {}
+        self.writes = 0
+        self._rng = random.Random(seed)
+        self._failures = 0
+        self._docs = {}  # collection -> {doc_id: data}
+        self._listeners = []
+        self._lock = threading.RLock()
+
+    def fail_next(self, count=1):
+        self._failures += count
+
+    def documents(self, collection):
+        """{doc_id: data} as currently stored (copies)."""
+        with self._lock:
+            return {doc_id: dict(data) for doc_id, data in self._docs.get(collection, {}).items()}
+
+    def _call(self, kind):
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+            failing = self._failures > 0 or (self.failure_rate and self._rng.random() < self.failure_rate)
+            if self._failures > 0:
+                self._failures -= 1
+        if self.latency:
+            time.sleep(self.latency)
+        if failing:
+            raise BackendUnavailable(f"injected failure in {kind}")
+
+    def stream(self, collection):
+        docs = list(self.documents(collection).items())
+        for start in range(0, max(len(docs), 1), self.STREAM_PAGE):
+            self._call('stream')
+            yield from docs[start:start + self.STREAM_PAGE]
+
+    def query(self, collection, field, after, page_size):
+        with self._lock:
+            matching = sorted(((data[field], doc_id) for doc_id, data in self._docs.get(collection, {}).items()
+                               if _after(data.get(field), after)))
+        for start in range(0, len(matching), page_size):
+            self._call('query')
+            with self._lock:
+                docs = self._docs.get(collection, {})
+                page = [(doc_id, dict(docs[doc_id])) for _, doc_id in matching[start:start + page_size]
+                        if doc_id in docs]
+            yield from page
+        if not matching:
+            self._call('query')
+
+    def new_id(self, collection):
+        return uuid.uuid4().hex[:20]
+
+    def batch(self):
+        return _MemoryBatch(self)
+
+    def listen(self, collection, callback, field=None, after=None):
+        self._call('listen')
+        listener = _MemoryListener(self, collection, callback, field, after)
+        with self._lock:
+            docs = self._docs.get(collection, {})
+            initial = [('ADDED', doc_id, dict(data)) for doc_id, data in docs.items()
+                       if listener.matches(data)]
+            self._listeners.append(listener)
+        if initial:
+            callback(initial)
+        return listener
+
+    def _commit(self, writes):
+        self._call('commit')
+        changes = {}
+        with self._lock:
+            for collection, doc_id, data, merge in writes:
+                docs = self._docs.setdefault(collection, {})
+                kind = 'MODIFIED' if doc_id in docs else 'ADDED'
+                if merge and doc_id in docs:
+                    docs[doc_id].update(data)
+                else:
+                    docs[doc_id] = dict(data)
+                changes.setdefault(collection, {})[doc_id] = (kind, dict(docs[doc_id]))
+            self.writes += len(writes)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            matched = [(kind, doc_id, data) for doc_id, (kind, data) in changes.get(listener.collection, {}).items()
+                       if listener.matches(data)]
+            if matched and listener.is_active:
+                listener.callback(matched)
+
+
+def _after(value, after):
+    return value is not None and (after is None or value > after)
+
+
+class _MemoryBatch:
+    def __init__(self, backend):
+        self.backend = backend
+        self._writes = []
+
+    def set(self, collection, doc_id, data, merge=False):
+        self._writes.append((collection, doc_id, data, merge))
+
+    def commit(self):
+        self.backend._commit(self._writes)
+
+
+class _MemoryListener:
+    def __init__(self, backend, collection, callback, field, after):
+        self.backend = backend
+        self.collection = collection
+        self.callback = callback
+        self.field = field
+        self.after = after
+        self.is_active = True
+
+    def matches(self, data):
+        return self.field is None or _after(data.get(self.field), self.after)
+
+    def unsubscribe(self):
+        self.is_active = False
+        with self.backend._lock:
+            if self in self.backend._listeners:
+                self.backend._listeners.remove(self)
+
+
+def firestore_backend():
+    """The Firestore project set up by firebase_config, or None when it is unavailable."""
+    try:
+        from firebase_config import db
+    except ImportError:
+        print("⚠️ Firebase not available - running in offline mode")
+        return None
+    return FirestoreBackend(db) if db is not None else None
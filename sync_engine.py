@@ -0,0 +1,302 @@
+"""Cloud sync engine shared by the desktop and mobile apps.
+
+A sync pulls what changed remotely, then pushes the local outbox (see
+sync_state.py). Network and SQLite work overlap: pulled documents are
+downloaded on their own thread while earlier chunks are applied, and batch
+commits run on a small pool while the next batch is read. The phases run
+concurrently as far as their order allows:
+
+    pull customers --+--> push customers --------------+--> push transactions
+                     +--> apply transactions (prefetched from the start)
+
+Transactions refer to customers by firebase_id, so customers come first,
+and a collection is pulled before it is pushed so a stale local row never
+overwrites a newer document.
+"""
+import queue
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+
+from database import transaction
+from sync_backend import firestore_backend
+from sync_listener import SnapshotListener
+from sync_state import (APPLY_CHUNK_SIZE, WATERMARK_FIELD, BatchWriter, ack_outbox, advance_watermark,
+                        apply_customer_docs, apply_transaction_docs, clear_watermarks, drain_outbox,
+                        get_watermark, iter_changes, outbox_row_ids)
+
+# Downloaded chunks (of APPLY_CHUNK_SIZE docs) waiting to be applied, per collection
+PREFETCH_CHUNKS = 4
+
+# Batch commits in flight at once while pushing
+COMMIT_WORKERS = 2
+
+_DONE = object()
+
+
+def get_current_timestamp():
+    return datetime.now().isoformat()
+
+
+class _Prefetch:
+    """Downloads a collection's changes on its own thread, a chunk ahead of the local apply."""
+
+    def __init__(self, backend, collection):
+        watermark = get_watermark(collection)
+        # A range query arrives in last_sync order, so the mark can follow each chunk
+        self.ordered = watermark is not None
+        self._chunks = queue.Queue(maxsize=PREFETCH_CHUNKS)
+        self._cancelled = threading.Event()
+        docs = iter_changes(backend, collection, watermark)
+        threading.Thread(target=self._run, args=(docs,), name=f'prefetch-{collection}', daemon=True).start()
+
+    def __iter__(self):
+        while True:
+            item = self._chunks.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _run(self, docs):
+        try:
+            chunk = []
+            for doc in docs:
+                chunk.append(doc)
+                if len(chunk) >= APPLY_CHUNK_SIZE:
+                    if not self._put(chunk):
+                        return
+                    chunk = []
+            if chunk and not self._put(chunk):
+                return
+            self._put(_DONE)
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        while not self._cancelled.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+class SyncEngine:
+    """Two-way sync between the local database and a SyncBackend (Firestore by default).
+
+    source, when set, is stored on every pushed document; the desktop app
+    tags its writes 'desktop'.
+    """
+
+    def __init__(self, backend=None, source=None):
+        self.backend = backend if backend is not None else firestore_backend()
+        self.source = source
+        self.listener = None
+        self.last_sync_time = None
+        # Full syncs and write-behind pushes run on different threads; one at a time,
+        # so a row without a firebase_id is never created twice in the cloud
+        self._lock = threading.RLock()
+        self._phases = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sync-phase')
+        self._commits = ThreadPoolExecutor(max_workers=COMMIT_WORKERS, thread_name_prefix='sync-commit')
+
+    def is_connected(self):
+        return self.backend is not None
+
+    def start_listening(self, post=None, on_applied=None):
+        """Pull remote changes as they happen; sync_all_data() then only pulls while the listener is down."""
+        if not self.is_connected():
+            return False
+        self.stop_listening()
+        self.listener = SnapshotListener(self.backend, post=post, on_applied=on_applied)
+        self.listener.start()
+        return True
+
+    def stop_listening(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def sync_all_data(self, resync=False):
+        """Two-way sync; pulls only what changed since the last one unless resync is set.
+
+        Returns (success, message). Safe to call from a worker thread; it never touches the UI.
+        """
+        if not self.is_connected():
+            print("Firebase not connected - skipping sync")
+            return False, "Firebase not connected"
+        with self._lock:
+            try:
+                print("Starting full two-way sync...")
+                if resync:
+                    with transaction() as conn:
+                        clear_watermarks(conn)
+                pull = resync or self.listener is None or not self.listener.live
+                pulled, pushed = self._sync(pull)
+            except Exception as e:
+                error_message = f"Sync failed: {str(e)}"
+                print(error_message)
+                traceback.print_exc()
+                return False, error_message
+            if pull and self.listener is not None:
+                self.listener.start()
+        self.last_sync_time = get_current_timestamp()
+        summary = (f"Sync completed.\n"
+                   f"Pulled: {pulled[0]} customers, {pulled[1]} transactions.\n"
+                   f"Pushed: {pushed[0]} customers, {pushed[1]} transactions.")
+        print(summary)
+        return True, summary
+
+    def _sync(self, pull):
+        customers_pulled = transactions_pulled = 0
+        if pull:
+            # Transactions download while customers are fetched and applied
+            transactions = _Prefetch(self.backend, 'transactions')
+            try:
+                customers_pulled = self._apply_pulled('customers', _Prefetch(self.backend, 'customers'))
+            except Exception:
+                transactions.cancel()
+                raise
+        pushing_customers = self._phases.submit(self.push_customers_to_firebase)
+        try:
+            if pull:
+                transactions_pulled = self._apply_pulled('transactions', transactions)
+        finally:
+            wait([pushing_customers])
+        customers_pushed = pushing_customers.result()
+        transactions_pushed = self.push_transactions_to_firebase()
+        return (customers_pulled, transactions_pulled), (customers_pushed, transactions_pushed)
+
+    def _apply_pulled(self, collection, prefetch):
+        """Apply prefetched chunks as they arrive; returns how many rows changed.
+
+        A full stream is unordered, so its mark only moves once every chunk is in.
+        """
+        applied, newest, orphans = 0, None, []
+        try:
+            for chunk in prefetch:
+                if collection == 'customers':
+                    applied += apply_customer_docs(chunk, advance=prefetch.ordered)
+                else:
+                    applied += apply_transaction_docs(chunk, orphans, advance=prefetch.ordered)
+                stamped = [doc for doc in chunk if isinstance(doc[1].get(WATERMARK_FIELD), str)]
+                if stamped:
+                    latest = max(stamped, key=lambda doc: doc[1][WATERMARK_FIELD])
+                    if newest is None or latest[1][WATERMARK_FIELD] > newest[1][WATERMARK_FIELD]:
+                        newest = latest
+        except Exception:
+            prefetch.cancel()
+            raise
+        if not prefetch.ordered and newest is not None:
+            with transaction() as conn:
+                advance_watermark(conn, collection, [newest], orphans)
+        return applied
+
+    def push_changes(self, customer_ids=(), transaction_ids=()):
+        """Drain the outbox; returns which of (customer_ids, transaction_ids) are still waiting in it."""
+        if not self.is_connected():
+            return set(customer_ids), set(transaction_ids)
+        with self._lock:
+            self.push_customers_to_firebase()
+            self.push_transactions_to_firebase()
+            return outbox_row_ids('customers', customer_ids), outbox_row_ids('transactions', transaction_ids)
+
+    def pending_changes(self):
+        """Ids of every customer and transaction not yet pushed, e.g. left over from the last session."""
+        return outbox_row_ids('customers'), outbox_row_ids('transactions')
+
+    def _document(self, data):
+        data['last_sync'] = get_current_timestamp()
+        if self.source:
+            data['source'] = self.source
+        return data
+
+    def _writer(self, table):
+        return BatchWriter(self.backend, lambda synced: self._mark_synced(table, synced), executor=self._commits)
+
+    def push_customers_to_firebase(self):
+        """Push the customers queued in the outbox, oldest change first; returns how many were written."""
+        if not self.is_connected(): return 0
+        writer = self._writer('customers')
+        queued = drain_outbox('customers', """
+            SELECT id, name, display_name, phone_number, balance, created_at, updated_at, firebase_id
+            FROM customers WHERE id IN ({ids})""")
+        try:
+            for seq, local_id, customer, _ in queued:
+                if customer is None:
+                    continue
+                (local_id, name, display_name, phone_number, balance, created_at,
+                 updated_at, firebase_id) = customer
+                customer_data = self._document({
+                    'name': name, 'display_name': display_name, 'phone_number': phone_number, 'balance': balance,
+                    'created_at': created_at, 'updated_at': updated_at, 'local_id': local_id
+                })
+                # New documents get their id client-side, so no round trip is needed per row
+                doc_id = firebase_id or self.backend.new_id('customers')
+                writer.set('customers', doc_id, customer_data, merge=bool(firebase_id),
+                           record=(doc_id, updated_at, local_id, seq))
+        finally:
+            writer.flush()
+        return writer.committed
+
+    def push_transactions_to_firebase(self):
+        """Push the transactions queued in the outbox, oldest change first; deleted ones are marked is_deleted."""
+        if not self.is_connected(): return 0
+        writer = self._writer('transactions')
+        queued = drain_outbox('transactions', """
+            SELECT t.id, t.customer_id, t.date, t.time, t.action, t.product,
+                   t.quantity, t.amount, t.actual_borrower, t.created_at,
+                   t.updated_at, t.firebase_id, t.is_deleted,
+                   c.firebase_id as customer_firebase_id
+            FROM transactions t LEFT JOIN customers c ON t.customer_id = c.id
+            WHERE t.id IN ({ids})""")
+        skipped = 0
+        try:
+            for seq, local_id, tx, deleted_firebase_id in queued:
+                if tx is None:
+                    # Deleted here after it was pushed; flag the document so other devices drop it too
+                    writer.set('transactions', deleted_firebase_id,
+                               self._document({'is_deleted': 1, 'updated_at': get_current_timestamp()}),
+                               merge=True, record=(deleted_firebase_id, None, local_id, seq))
+                    continue
+                (local_id, customer_id, date, time, action, product, quantity,
+                 amount, actual_borrower, created_at, updated_at,
+                 firebase_id, is_deleted, customer_firebase_id) = tx
+                if not customer_firebase_id:
+                    # Stays queued until its customer has been pushed
+                    skipped += 1
+                    continue
+                transaction_data = self._document({
+                    'customer_firebase_id': customer_firebase_id, 'date': date, 'time': time, 'action': action,
+                    'product': product, 'quantity': quantity, 'amount': amount, 'actual_borrower': actual_borrower,
+                    'created_at': created_at, 'updated_at': updated_at, 'local_id': local_id,
+                    'is_deleted': is_deleted
+                })
+                doc_id = firebase_id or self.backend.new_id('transactions')
+                writer.set('transactions', doc_id, transaction_data, merge=bool(firebase_id),
+                           record=(doc_id, updated_at, local_id, seq))
+        finally:
+            writer.flush()
+        if skipped:
+            print(f"Skipped {skipped} transaction(s) whose customer is not synced yet")
+        return writer.committed
+
+    def _mark_synced(self, table, synced):
+        """Record pushed rows and drop their outbox entries in one short write.
+
+        synced is [(firebase_id, updated_at, local_id, seq)]; a row edited
+        during the push keeps its newer entry and stays pending.
+        """
+        if not synced:
+            return
+        with transaction() as conn:
+            conn.executemany(f"""UPDATE {table} SET firebase_id = ?,
+                                 sync_status = CASE WHEN updated_at = ? THEN 'synced' ELSE sync_status END
+                                 WHERE id = ?""", [record[:3] for record in synced])
+            ack_outbox(conn, table, [(local_id, seq) for _, _, local_id, seq in synced])
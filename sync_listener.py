@@ -0,0 +1,109 @@
+"""Real-time pulls: backend snapshot listeners feeding the local database."""
+import queue
+import threading
+import traceback
+
+from database import close_connection
+from sync_state import apply_customer_docs, apply_transaction_docs, get_watermark, watch_changes
+
+COLLECTIONS = ('customers', 'transactions')
+
+
+class SnapshotListener:
+    """Applies remote changes as the backend reports them, instead of on the next poll.
+
+    Each collection gets a listener (on_snapshot, for Firestore) on the
+    documents past its watermark, so a restart resumes where the last
+    applied change left off (the first snapshot replays anything missed).
+    Listener callbacks only queue the changed documents; one worker thread
+    applies them in bulk, customers before transactions, folding whatever
+    queued up meanwhile into the same write. Transactions whose customer
+    has not arrived are kept and offered again with the next batch.
+
+    live is False once a listener has stopped or an apply has failed; the
+    periodic sync then pulls as before and restarts the listener. The UI
+    toolkit is plugged in through post(callback), as for SyncWorker, and
+    on_applied(count) is always called through it.
+    """
+
+    def __init__(self, backend, post=None, on_applied=None, name='snapshot-listener'):
+        self.backend = backend
+        self.on_applied = on_applied
+        self._post = post
+        self._name = name
+        self._queue = queue.Queue()
+        self._watches = {}
+        self._orphans = {}
+        self._failed = False
+        self._worker = None
+
+    @property
+    def live(self):
+        return (bool(self._watches) and not self._failed
+                and all(getattr(watch, 'is_active', True) for watch in self._watches.values()))
+
+    def start(self):
+        """Attach (or re-attach) the listeners from the current watermarks."""
+        self._unsubscribe()
+        self._failed = False
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name=self._name, daemon=True)
+            self._worker.start()
+        for collection in COLLECTIONS:
+            self._watches[collection] = watch_changes(
+                self.backend, collection, get_watermark(collection),
+                lambda changes, c=collection: self._on_snapshot(c, changes))
+
+    def stop(self):
+        self._unsubscribe()
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker = None
+
+    def _unsubscribe(self):
+        watches, self._watches = self._watches, {}
+        for watch in watches.values():
+            try:
+                watch.unsubscribe()
+            except Exception:
+                traceback.print_exc()
+
+    def _on_snapshot(self, collection, changes):
+        # Runs on the Firestore client's thread: hand the documents over and return.
+        # Deletes arrive as is_deleted updates; REMOVED only means a document left the query.
+        docs = [(doc_id, data) for kind, doc_id, data in changes if kind != 'REMOVED']
+        if docs:
+            self._queue.put((collection, docs))
+
+    def _run(self):
+        try:
+            while True:
+                item = self._queue.get()
+                pending = {collection: {} for collection in COLLECTIONS}
+                while item is not None:
+                    collection, docs = item
+                    pending[collection].update(docs)
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                if pending['customers'] or pending['transactions']:
+                    self._apply(pending)
+                if item is None:
+                    return
+        finally:
+            close_connection()
+
+    def _apply(self, pending):
+        try:
+            applied = apply_customer_docs(list(pending['customers'].items()))
+            transactions = {**self._orphans, **pending['transactions']}
+            orphans = []
+            applied += apply_transaction_docs(list(transactions.items()), orphans)
+            self._orphans = dict(orphans)
+        except Exception:
+            traceback.print_exc()
+            self._failed = True
+            return
+        if applied and self.on_applied and self._post:
+            self._post(lambda *_, n=applied: self.on_applied(n))
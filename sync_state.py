@@ -0,0 +1,384 @@
+"""Delta pulls, bulk local apply and batched pushes, shared by the desktop and mobile sync services.
+
+Every pushed document carries last_sync, the time it was written to the
+cloud. Each collection keeps a persisted high-water mark of the newest
+last_sync applied locally, and the next pull only asks for documents past
+it, in last_sync order, one page at a time. A pull without a mark (first
+run, or an explicit resync) still streams the whole collection.
+
+Pushes drain sync_outbox, the change log the schema triggers append to on
+every local write, oldest change first. An entry is removed once the batch
+carrying it has committed, so a crash or a failed commit only means the
+same rows are sent again.
+"""
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from database import get_connection, transaction
+from ledger import occurred_at
+
+# Documents per page of a delta pull
+PULL_PAGE_SIZE = 500
+
+# Pulled rows applied per local write transaction, and ids per IN (...) lookup
+APPLY_CHUNK_SIZE = 500
+
+# Most writes Firestore accepts in one batch commit
+BATCH_SIZE = 500
+
+# Re-read this far behind the mark, so a device whose clock runs a little slow
+# is not skipped; re-applying a document is harmless (updated_at decides).
+WATERMARK_OVERLAP = timedelta(minutes=10)
+
+# A document that cannot be applied holds the mark back for at most this long,
+# so one orphan cannot pin every later pull to the same range.
+HOLD_BACK_LIMIT = timedelta(days=1)
+
+WATERMARK_FIELD = 'last_sync'
+
+
+def get_watermark(collection):
+    row = get_connection().execute('SELECT watermark FROM sync_state WHERE collection = ?', (collection,)).fetchone()
+    return row[0] if row else None
+
+
+def advance_watermark(conn, collection, docs, held_back=()):
+    """Move a collection's mark past the applied docs, inside the caller's transaction.
+
+    held_back are docs that could not be applied yet (e.g. their customer has
+    not arrived); the mark stops at the oldest recent one so it is read again.
+    The mark never moves backwards.
+    """
+    stamps = [data.get(WATERMARK_FIELD) for _, data in docs]
+    stamps = [stamp for stamp in stamps if isinstance(stamp, str)]
+    if not stamps:
+        return
+    watermark = max(stamps)
+    held = [data.get(WATERMARK_FIELD) for _, data in held_back]
+    oldest_held = (datetime.now() - HOLD_BACK_LIMIT).isoformat()
+    held = [stamp for stamp in held if isinstance(stamp, str) and stamp > oldest_held]
+    if held:
+        watermark = min(watermark, min(held))
+    conn.execute('''INSERT INTO sync_state (collection, watermark) VALUES (?, ?)
+                    ON CONFLICT (collection) DO UPDATE SET watermark = excluded.watermark
+                    WHERE sync_state.watermark IS NULL OR excluded.watermark > sync_state.watermark''',
+                 (collection, watermark))
+
+
+def clear_watermarks(conn):
+    """Forget every mark so the next pull is a full resync."""
+    conn.execute('DELETE FROM sync_state')
+
+
+def _overlap(watermark):
+    try:
+        return (datetime.fromisoformat(watermark) - WATERMARK_OVERLAP).isoformat()
+    except (TypeError, ValueError):
+        return watermark
+
+
+def watch_changes(backend, collection, watermark, callback):
+    """Listen for the documents changed since watermark (all of them without one); see SyncBackend.listen()."""
+    if watermark is None:
+        return backend.listen(collection, callback)
+    return backend.listen(collection, callback, WATERMARK_FIELD, _overlap(watermark))
+
+
+def iter_changes(backend, collection, watermark=None, page_size=PULL_PAGE_SIZE):
+    """The documents changed since watermark, as (doc_id, data), downloaded as they are iterated.
+
+    With no watermark the whole collection is streamed (resync), in no
+    particular order; otherwise it is a paged last_sync range query, in
+    last_sync order.
+    """
+    if watermark is None:
+        return backend.stream(collection)
+    return backend.query(collection, WATERMARK_FIELD, _overlap(watermark), page_size)
+
+
+def fetch_changes(backend, collection, watermark=None, page_size=PULL_PAGE_SIZE):
+    """Download the documents changed since watermark as [(doc_id, data)]; see iter_changes()."""
+    return list(iter_changes(backend, collection, watermark, page_size))
+
+
+def _chunks(items, size=APPLY_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _by_firebase_id(conn, table, columns, firebase_ids):
+    """{firebase_id: row} for just these ids, read in chunks off the firebase_id index."""
+    found = {}
+    for chunk in _chunks(list(firebase_ids)):
+        rows = conn.execute(f"SELECT firebase_id, {columns} FROM {table} "
+                            f"WHERE firebase_id IN ({','.join('?' * len(chunk))})", chunk)
+        found.update((row[0], row[1:]) for row in rows)
+    return found
+
+
+def _pending_deletes(conn, firebase_ids):
+    """The firebase_ids among these whose local delete is still waiting in the outbox."""
+    pending = set()
+    for chunk in _chunks(list(firebase_ids)):
+        pending.update(row[0] for row in conn.execute(
+            f"SELECT deleted_firebase_id FROM sync_outbox WHERE table_name = 'transactions' "
+            f"AND deleted_firebase_id IN ({','.join('?' * len(chunk))})", chunk))
+    return pending
+
+
+def _is_newer(remote_updated_at, local_updated_at):
+    return bool(remote_updated_at) and (local_updated_at is None or remote_updated_at > local_updated_at)
+
+
+_UPSERT_CUSTOMER = '''
+    INSERT INTO customers (id, name, display_name, phone_number, balance, created_at, updated_at,
+                           sync_status, firebase_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, 'synced', ?)
+    ON CONFLICT (id) DO UPDATE SET
+        name = excluded.name, display_name = excluded.display_name, phone_number = excluded.phone_number,
+        balance = excluded.balance, created_at = excluded.created_at, updated_at = excluded.updated_at,
+        sync_status = 'synced', firebase_id = excluded.firebase_id
+    WHERE customers.updated_at IS NULL OR excluded.updated_at > customers.updated_at'''
+
+_UPSERT_TRANSACTION = '''
+    INSERT INTO transactions (id, customer_id, date, time, occurred_at, action, product, quantity, amount,
+                              actual_borrower, created_at, updated_at, sync_status, firebase_id, is_deleted)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'synced', ?, 0)
+    ON CONFLICT (id) DO UPDATE SET
+        customer_id = excluded.customer_id, date = excluded.date, time = excluded.time,
+        occurred_at = excluded.occurred_at, action = excluded.action, product = excluded.product,
+        quantity = excluded.quantity, amount = excluded.amount, actual_borrower = excluded.actual_borrower,
+        created_at = excluded.created_at, updated_at = excluded.updated_at,
+        sync_status = 'synced', firebase_id = excluded.firebase_id
+    WHERE transactions.updated_at IS NULL OR excluded.updated_at > transactions.updated_at'''
+
+
+def _apply_in_chunks(collection, docs, sql, rows, held_back=(), before=None, advance=True):
+    """Write rows with executemany, APPLY_CHUNK_SIZE per transaction, then advance the mark."""
+    chunks = list(_chunks(rows)) or [[]]
+    for number, chunk in enumerate(chunks, 1):
+        with transaction() as conn:
+            if before and number == 1:
+                before(conn)
+            if chunk:
+                conn.executemany(sql, chunk)
+            if advance and number == len(chunks):
+                advance_watermark(conn, collection, docs, held_back)
+
+
+def apply_customer_docs(docs, advance=True):
+    """Apply pulled customer documents locally; returns how many rows were inserted or updated.
+
+    A remote document wins only when its updated_at is newer than the local row's.
+    advance=False leaves the watermark alone, for docs that arrived out of order.
+    """
+    known = _by_firebase_id(get_connection(), 'customers', 'id, updated_at', [fid for fid, _ in docs])
+    rows = []
+    for firebase_id, data in docs:
+        if firebase_id in known:
+            local_id, local_updated_at = known[firebase_id]
+            if not _is_newer(data.get('updated_at'), local_updated_at):
+                continue
+        else:
+            local_id = data.get('local_id', str(uuid.uuid4()))
+        rows.append((local_id, data.get('name'), data.get('display_name'), data.get('phone_number'),
+                     data.get('balance'), data.get('created_at'), data.get('updated_at'), firebase_id))
+    _apply_in_chunks('customers', docs, _UPSERT_CUSTOMER, rows, advance=advance)
+    return len(rows)
+
+
+def apply_transaction_docs(docs, orphans=None, advance=True):
+    """Apply pulled transaction documents locally; returns how many rows changed.
+
+    Documents flagged is_deleted are removed; those deleted here whose
+    delete is still in the outbox are skipped, so the delete gets pushed.
+    Those whose customer is not known locally yet are held back (see advance_watermark()) and, when an
+    orphans list is given, added to it so the caller can offer them again;
+    orphans already in it keep holding the mark back too. advance=False
+    leaves the watermark alone, as for apply_customer_docs().
+    """
+    conn = get_connection()
+    live = [(fid, data) for fid, data in docs if data.get('is_deleted') != 1]
+    deleted = [(fid,) for fid, data in docs if data.get('is_deleted') == 1]
+    # Deleted here but not pushed yet: the cloud copy is stale, and re-inserting
+    # it would turn the queued delete into a push of a live row
+    tombstoned = _pending_deletes(conn, [fid for fid, _ in live])
+    live = [(fid, data) for fid, data in live if fid not in tombstoned]
+    customers = _by_firebase_id(conn, 'customers', 'id', {data.get('customer_firebase_id') for _, data in live})
+    known = _by_firebase_id(conn, 'transactions', 'id, updated_at', [fid for fid, _ in live])
+    rows, held_back = [], []
+    for firebase_id, data in live:
+        customer = customers.get(data.get('customer_firebase_id'))
+        if customer is None:
+            held_back.append((firebase_id, data))
+            continue
+        if firebase_id in known:
+            local_id, local_updated_at = known[firebase_id]
+            if not _is_newer(data.get('updated_at'), local_updated_at):
+                continue
+        else:
+            local_id = data.get('local_id', str(uuid.uuid4()))
+        rows.append((local_id, customer[0], data.get('date'), data.get('time'),
+                     occurred_at(data.get('date'), data.get('time')), data.get('action'), data.get('product'),
+                     data.get('quantity'), data.get('amount'), data.get('actual_borrower'),
+                     data.get('created_at'), data.get('updated_at'), firebase_id))
+    if held_back:
+        print(f"Holding back {len(held_back)} transaction(s) whose customer is not known locally yet")
+    if orphans is not None:
+        orphans.extend(held_back)
+        held_back = orphans
+
+    removed = 0
+
+    def delete(conn):
+        nonlocal removed
+        # Re-reads of documents deleted long ago match nothing and do not count
+        removed = conn.executemany('DELETE FROM transactions WHERE firebase_id = ?', deleted).rowcount
+        # The delete trigger queued these for the cloud, which already has them deleted
+        conn.executemany("DELETE FROM sync_outbox WHERE table_name = 'transactions' AND deleted_firebase_id = ?",
+                         deleted)
+
+    _apply_in_chunks('transactions', docs, _UPSERT_TRANSACTION, rows, held_back, before=delete, advance=advance)
+    return len(rows) + removed
+
+
+def drain_outbox(table, select_sql, page_size=BATCH_SIZE):
+    """Yield (seq, row_id, row, deleted_firebase_id) for the queued changes to table, oldest first.
+
+    select_sql reads the current rows, id first, and ends in "IN ({ids})" over
+    the row ids. A row changed several times is yielded once, where its
+    oldest entry falls, with its newest seq; row is None when it has since
+    been deleted. Deleted rows the cloud never had are dropped from the
+    outbox here. Changes queued while draining are left for the next drain.
+    """
+    conn = get_connection()
+    last_seq = conn.execute('SELECT MAX(seq) FROM sync_outbox WHERE table_name = ?', (table,)).fetchone()[0]
+    after = 0
+    while last_seq is not None and after < last_seq:
+        entries = conn.execute('''SELECT seq, row_id FROM sync_outbox
+                                  WHERE table_name = ? AND seq > ? AND seq <= ? ORDER BY seq LIMIT ?''',
+                               (table, after, last_seq, page_size)).fetchall()
+        if not entries:
+            return
+        page_start, after = after, entries[-1][0]
+        ids = list(dict.fromkeys(row_id for _, row_id in entries))
+        marks = ','.join('?' * len(ids))
+        # Rows whose oldest entry is on an earlier page were yielded there (or are already acked)
+        latest = {row_id: (newest, deleted_firebase_id) for row_id, oldest, newest, deleted_firebase_id in conn.execute(
+            f'''SELECT row_id, MIN(seq), MAX(seq), MAX(deleted_firebase_id) FROM sync_outbox
+                WHERE table_name = ? AND seq <= ? AND row_id IN ({marks}) GROUP BY row_id''',
+            [table, last_seq, *ids]) if oldest > page_start}
+        ids = [row_id for row_id in ids if row_id in latest]
+        if not ids:
+            continue
+        rows = {row[0]: row for row in conn.execute(select_sql.format(ids=','.join('?' * len(ids))), ids)}
+        vanished = [(row_id, seq) for row_id, (seq, deleted_firebase_id) in latest.items()
+                    if row_id not in rows and deleted_firebase_id is None]
+        if vanished:
+            with transaction() as write:
+                ack_outbox(write, table, vanished)
+        for row_id in ids:
+            seq, deleted_firebase_id = latest[row_id]
+            if row_id in rows or deleted_firebase_id is not None:
+                yield seq, row_id, rows.get(row_id), deleted_firebase_id
+
+
+def ack_outbox(conn, table, acked):
+    """Drop the outbox entries the cloud now has, inside the caller's transaction.
+
+    acked is [(row_id, seq)]; a row's entries up to that seq are removed,
+    later changes to it stay queued.
+    """
+    conn.executemany('DELETE FROM sync_outbox WHERE table_name = ? AND row_id = ? AND seq <= ?',
+                     [(table, row_id, seq) for row_id, seq in acked])
+
+
+def forget_outbox(conn, table, row_ids):
+    """Drop every queued change to these rows, inside the caller's transaction.
+
+    For local housekeeping deletes the cloud should not hear about; without
+    it, deleting a synced transaction queues its document to be deleted too.
+    """
+    for chunk in _chunks(list(row_ids)):
+        conn.execute(f"DELETE FROM sync_outbox WHERE table_name = ? AND row_id IN ({','.join('?' * len(chunk))})",
+                     [table, *chunk])
+
+
+def outbox_row_ids(table, row_ids=None):
+    """The ids of table (or of just row_ids) with changes still waiting in the outbox."""
+    conn = get_connection()
+    if row_ids is None:
+        return {row[0] for row in conn.execute('SELECT DISTINCT row_id FROM sync_outbox WHERE table_name = ?',
+                                               (table,))}
+    queued = set()
+    for chunk in _chunks(list(row_ids)):
+        queued.update(row[0] for row in conn.execute(
+            f"SELECT DISTINCT row_id FROM sync_outbox WHERE table_name = ? "
+            f"AND row_id IN ({','.join('?' * len(chunk))})", [table, *chunk]))
+    return queued
+
+
+class BatchWriter:
+    """Groups document writes into backend batch commits of up to BATCH_SIZE.
+
+    Each set() carries a record for the local row; after a batch commits,
+    on_commit(records) is called with that batch's records, so local sync
+    state only changes for rows the cloud actually has. A failed commit
+    raises and leaves its rows pending.
+
+    With an executor, a full batch commits there while the caller goes on
+    filling the next one; at most in_flight commits run at once, and
+    flush() waits for all of them.
+    """
+
+    def __init__(self, backend, on_commit, size=None, executor=None, in_flight=2):
+        self.backend = backend
+        self.on_commit = on_commit
+        self.size = size or BATCH_SIZE
+        self.in_flight = in_flight
+        self.committed = 0
+        self._executor = executor
+        self._running = []
+        self._lock = threading.Lock()
+        self._batch = None
+        self._records = []
+
+    def set(self, collection, doc_id, data, merge, record):
+        if self._batch is None:
+            self._batch = self.backend.batch()
+        self._batch.set(collection, doc_id, data, merge=merge)
+        self._records.append(record)
+        if len(self._records) >= self.size:
+            self._send()
+
+    def flush(self):
+        """Commit what is left and wait for every commit; raises the first that failed."""
+        self._send()
+        running, self._running = self._running, []
+        errors = []
+        for future in running:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+    def _send(self):
+        if not self._records:
+            return
+        batch, records = self._batch, self._records
+        self._batch, self._records = None, []
+        if self._executor is None:
+            self._commit(batch, records)
+            return
+        while len(self._running) >= self.in_flight:
+            self._running.pop(0).result()
+        self._running.append(self._executor.submit(self._commit, batch, records))
+
+    def _commit(self, batch, records):
+        batch.commit()
+        self.on_commit(records)
+        with self._lock:
+            self.committed += len(records)
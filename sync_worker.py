@@ -0,0 +1,203 @@
+"""Background cloud sync and periodic jobs shared by the desktop and mobile apps."""
+import random
+import threading
+import traceback
+
+from database import close_connection
+
+
+class SyncWorker:
+    """Runs a sync job on its own thread so the UI never waits on the network.
+
+    request() may be called from the UI thread at any time. Requests that
+    arrive while a sync is running are folded into a single follow-up run.
+    The UI toolkit is plugged in through one callable:
+
+        post(callback), to run a callback on the UI thread (safe from any thread)
+
+    on_start() and on_done((success, message)) are always called through post.
+    """
+
+    def __init__(self, sync, post, on_start=None, on_done=None, name='sync-worker'):
+        self.sync = sync
+        self.on_start = on_start
+        self.on_done = on_done
+        self._post = post
+        self._name = name
+        self._wanted = threading.Event()
+        self._running = threading.Event()
+        # Two first requests racing must not start two loops running sync() at once
+        self._start_lock = threading.Lock()
+        self._worker = None
+
+    @property
+    def running(self):
+        return self._running.is_set()
+
+    def request(self):
+        """Ask for a sync; returns at once. Safe from any thread."""
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=self._name, daemon=True)
+                self._worker.start()
+        self._wanted.set()
+
+    def _run(self):
+        try:
+            while True:
+                self._wanted.wait()
+                self._wanted.clear()
+                self._running.set()
+                if self.on_start:
+                    self._post(lambda *_: self.on_start())
+                try:
+                    result = self.sync()
+                except Exception as e:
+                    traceback.print_exc()
+                    result = (False, f"Sync failed: {e}")
+                self._running.clear()
+                if self.on_done:
+                    self._post(lambda *_, r=result: self.on_done(r))
+        finally:
+            close_connection()
+
+
+class JobScheduler:
+    """Runs named jobs on the UI thread, each on its own interval with jitter.
+
+    Every job has exactly one pending timer, so triggering a job early moves
+    that timer instead of starting another chain, and bursts of triggers
+    collapse into one run. The UI toolkit is plugged in through:
+
+        schedule(delay_seconds, callback) -> handle, and cancel(handle), for the timers
+    """
+    JITTER = 0.1
+
+    def __init__(self, schedule, cancel, jitter=None, rng=None):
+        self._schedule = schedule
+        self._cancel = cancel
+        self.jitter = self.JITTER if jitter is None else jitter
+        self._rng = rng or random.Random()
+        self._jobs = {}  # name -> [job, interval, timer handle]
+
+    def add(self, name, job, interval, first_delay=None):
+        """Run job every interval seconds (plus or minus the jitter), first after first_delay."""
+        self._jobs[name] = [job, interval, None]
+        self._arm(name, interval if first_delay is None else first_delay, jitter=first_delay is None)
+
+    def trigger(self, name, delay=0):
+        """Run a job after delay instead of at its next tick; repeated triggers coalesce."""
+        self._arm(name, delay, jitter=False)
+
+    def stop(self):
+        for name in self._jobs:
+            self._disarm(name)
+
+    def _arm(self, name, delay, jitter=True):
+        self._disarm(name)
+        if jitter:
+            delay *= 1 + self._rng.uniform(-self.jitter, self.jitter)
+        self._jobs[name][2] = self._schedule(delay, lambda *_: self._fire(name))
+
+    def _disarm(self, name):
+        entry = self._jobs[name]
+        if entry[2] is not None:
+            self._cancel(entry[2])
+            entry[2] = None
+
+    def _fire(self, name):
+        job, interval, _ = self._jobs[name]
+        self._jobs[name][2] = None
+        try:
+            job()
+        except Exception:
+            traceback.print_exc()
+        finally:
+            if self._jobs[name][2] is None:
+                self._arm(name, interval)
+
+
+class WriteBehindSync:
+    """Pushes locally written rows to the cloud shortly after the write, off the UI thread.
+
+    Writes report the ids they touched through mark_dirty(), which returns at
+    once. The first mark after a quiet spell arms a COALESCE_SECONDS timer, so a
+    burst of writes goes out as one push on a SyncWorker thread. Ids the push
+    could not deliver (offline, or a failed request) stay dirty and are retried
+    with exponential backoff. The cloud side and UI toolkit are plugged in through:
+
+        push(customer_ids, transaction_ids) -> (still_pending_customer_ids, still_pending_transaction_ids)
+        schedule(delay_seconds, callback) -> handle, and cancel(handle), for the timers
+        post(callback), to run a callback on the UI thread (safe from any thread)
+    """
+    COALESCE_SECONDS = 3
+    MIN_BACKOFF_SECONDS = 15
+    MAX_BACKOFF_SECONDS = 600
+
+    def __init__(self, push, schedule, cancel, post, on_done=None):
+        self.push = push
+        self.on_done = on_done
+        self._schedule = schedule
+        self._cancel = cancel
+        self._lock = threading.Lock()
+        self._customers = set()
+        self._transactions = set()
+        self._timer = None
+        self.backoff = 0
+        self._worker = SyncWorker(self._flush, post, on_done=self._pushed, name='write-behind-sync')
+
+    @property
+    def pending(self):
+        with self._lock:
+            return len(self._customers) + len(self._transactions)
+
+    def mark_dirty(self, customer_ids=(), transaction_ids=()):
+        """Queue rows for the next push. UI thread only."""
+        with self._lock:
+            self._customers.update(customer_ids)
+            self._transactions.update(transaction_ids)
+        # A pending timer (coalescing window or backoff) will pick these up too
+        if self._timer is None:
+            self._timer = self._schedule(self.COALESCE_SECONDS, self._fire)
+
+    def flush(self):
+        """Push everything dirty now, skipping the coalescing window or backoff. UI thread only."""
+        if self._timer is not None:
+            self._cancel(self._timer)
+        self._fire()
+
+    def _fire(self, *_):
+        self._timer = None
+        self._worker.request()
+
+    def _flush(self):
+        with self._lock:
+            customers, transactions = self._customers, self._transactions
+            self._customers, self._transactions = set(), set()
+        if not customers and not transactions:
+            return True, "Nothing to push"
+        try:
+            left_customers, left_transactions = self.push(customers, transactions)
+        except Exception:
+            traceback.print_exc()
+            left_customers, left_transactions = customers, transactions
+        with self._lock:
+            self._customers |= left_customers
+            self._transactions |= left_transactions
+        left = len(left_customers) + len(left_transactions)
+        if left:
+            return False, f"{left} change(s) not pushed"
+        return True, f"Pushed {len(customers) + len(transactions)} change(s)"
+
+    def _pushed(self, result):
+        success, message = result
+        if success:
+            self.backoff = 0
+        else:
+            self.backoff = min(max(self.backoff * 2, self.MIN_BACKOFF_SECONDS), self.MAX_BACKOFF_SECONDS)
+            print(f"{message}; retrying in {self.backoff}s")
+            if self._timer is not None:
+                self._cancel(self._timer)
+            self._timer = self._schedule(self.backoff, self._fire)
+        if self.on_done:
+            self.on_done(result)
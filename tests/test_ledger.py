@@ -0,0 +1,198 @@
+"""Balances kept by delta on every ledger write, the explicit repair path, and overdue penalties."""
+import os
+import sys
+import tempfile
+import unittest
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import schema  # noqa: E402
+from database import get_connection, transaction  # noqa: E402
+from ledger import (PENALTY_AMOUNT, apply_balance_delta, apply_overdue_penalties, balance_effect,  # noqa: E402
+                    ledger_balance, occurred_at, repair_balances)
+
+
+class LedgerTest(unittest.TestCase):
+    """Each test gets a fresh database file and one customer, Ana."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self._original_path = database.DB_PATH
+        database.configure(os.path.join(self._tmp.name, 'ledger.db'))
+        schema.upgrade()
+        self.ana = self.add_customer('Ana')
+
+    def tearDown(self):
+        database.close_connection()
+        database.configure(self._original_path)
+        self._tmp.cleanup()
+
+    def add_customer(self, name, balance=0.0):
+        now = datetime.now().isoformat()
+        customer_id = str(uuid.uuid4())
+        with transaction() as conn:
+            conn.execute('''INSERT INTO customers (id, name, display_name, balance, created_at, updated_at)
+                            VALUES (?, ?, ?, ?, ?, ?)''', (customer_id, name.lower(), name, balance, now, now))
+        return customer_id
+
+    def add_entry(self, customer_id, action, amount, when=None):
+        """Write a ledger row the way both apps do: the row, then its balance delta."""
+        when = when or datetime.now()
+        date, time_ = when.strftime('%Y-%m-%d'), when.strftime('%H:%M')
+        transaction_id = str(uuid.uuid4())
+        with transaction() as conn:
+            conn.execute('''INSERT INTO transactions (id, customer_id, date, time, occurred_at, action, product,
+                                                      quantity, amount, created_at, updated_at)
+                            VALUES (?, ?, ?, ?, ?, ?, 'Rice', 1, ?, ?, ?)''',
+                         (transaction_id, customer_id, date, time_, occurred_at(date, time_), action, amount,
+                          when.isoformat(), when.isoformat()))
+            apply_balance_delta(conn, customer_id, balance_effect(action, amount))
+        return transaction_id
+
+    def edit_entry(self, transaction_id, action, amount):
+        with transaction() as conn:
+            customer_id, old_action, old_amount = conn.execute(
+                'SELECT customer_id, action, amount FROM transactions WHERE id = ?', (transaction_id,)).fetchone()
+            conn.execute('UPDATE transactions SET action = ?, amount = ? WHERE id = ?',
+                         (action, amount, transaction_id))
+            return apply_balance_delta(conn, customer_id,
+                                       balance_effect(action, amount) - balance_effect(old_action, old_amount))
+
+    def delete_entry(self, transaction_id):
+        with transaction() as conn:
+            customer_id, action, amount = conn.execute(
+                'SELECT customer_id, action, amount FROM transactions WHERE id = ?', (transaction_id,)).fetchone()
+            conn.execute('DELETE FROM transactions WHERE id = ?', (transaction_id,))
+            return apply_balance_delta(conn, customer_id, -balance_effect(action, amount))
+
+    def balance(self, customer_id):
+        return get_connection().execute('SELECT balance FROM customers WHERE id = ?', (customer_id,)).fetchone()[0]
+
+    def assertBalance(self, customer_id, expected):
+        self.assertAlmostEqual(self.balance(customer_id), expected)
+        self.assertAlmostEqual(ledger_balance(get_connection(), customer_id), expected)
+
+
+class BalanceDeltaTest(LedgerTest):
+    def test_each_action_moves_the_balance(self):
+        self.assertEqual(balance_effect('Credit Added', 10.0), 10.0)
+        self.assertEqual(balance_effect('Add Credit', 10.0), 10.0)
+        self.assertEqual(balance_effect('Overdue Penalty', 3.0), 3.0)
+        self.assertEqual(balance_effect('Paid', 10.0), -10.0)
+        self.assertEqual(balance_effect('Note', 10.0), 0)
+
+        self.add_entry(self.ana, 'Credit Added', 100.0)
+        self.assertBalance(self.ana, 100.0)
+        self.add_entry(self.ana, 'Add Credit', 20.0)
+        self.assertBalance(self.ana, 120.0)
+        self.add_entry(self.ana, 'Overdue Penalty', 3.0)
+        self.assertBalance(self.ana, 123.0)
+        self.add_entry(self.ana, 'Paid', 50.0)
+        self.assertBalance(self.ana, 73.0)
+
+    def test_edits_and_deletes_move_the_balance_back(self):
+        credit = self.add_entry(self.ana, 'Credit Added', 100.0)
+        penalty = self.add_entry(self.ana, 'Overdue Penalty', 3.0)
+        payment = self.add_entry(self.ana, 'Paid', 40.0)
+        self.assertBalance(self.ana, 63.0)
+
+        self.assertAlmostEqual(self.edit_entry(penalty, 'Overdue Penalty', 5.0), 65.0)
+        self.assertBalance(self.ana, 65.0)
+        self.edit_entry(payment, 'Credit Added', 40.0)
+        self.assertBalance(self.ana, 145.0)
+        self.assertAlmostEqual(self.delete_entry(penalty), 140.0)
+        self.assertBalance(self.ana, 140.0)
+        self.delete_entry(credit)
+        self.assertBalance(self.ana, 40.0)
+
+    def test_soft_deleted_rows_do_not_count(self):
+        self.add_entry(self.ana, 'Credit Added', 100.0)
+        hidden = self.add_entry(self.ana, 'Credit Added', 30.0)
+        with transaction() as conn:
+            conn.execute('UPDATE transactions SET is_deleted = 1 WHERE id = ?', (hidden,))
+        self.assertAlmostEqual(ledger_balance(get_connection(), self.ana), 100.0)
+
+    def test_removed_customer_is_recomputed_from_the_ledger(self):
+        self.add_entry(self.ana, 'Credit Added', 100.0)
+        with transaction() as conn:
+            conn.execute('UPDATE customers SET balance = -1 WHERE id = ?', (self.ana,))
+        self.add_entry(self.ana, 'Paid', 30.0)
+        self.assertBalance(self.ana, 70.0)
+
+
+class RepairBalancesTest(LedgerTest):
+    def test_reports_and_fixes_drift(self):
+        self.add_entry(self.ana, 'Credit Added', 100.0)
+        self.add_entry(self.ana, 'Paid', 25.0)
+        ben = self.add_customer('Ben')
+        self.add_entry(ben, 'Credit Added', 10.0)
+        with transaction() as conn:
+            conn.execute('UPDATE customers SET balance = 80 WHERE id = ?', (self.ana,))
+
+        self.assertEqual(repair_balances(fix=False), {self.ana: 75.0})
+        self.assertEqual(self.balance(self.ana), 80.0)
+
+        self.assertEqual(repair_balances(), {self.ana: 75.0})
+        self.assertBalance(self.ana, 75.0)
+        self.assertEqual(repair_balances(), {})
+
+    def test_full_run_skips_removed_customers(self):
+        self.add_entry(self.ana, 'Credit Added', 100.0)
+        with transaction() as conn:
+            conn.execute('UPDATE customers SET balance = -1 WHERE id = ?', (self.ana,))
+        self.assertEqual(repair_balances(), {})
+        self.assertEqual(repair_balances([self.ana], fix=False), {self.ana: 100.0})
+
+
+class OverduePenaltyTest(LedgerTest):
+    NOW = datetime(2026, 10, 17, 9, 0)
+
+    def penalties(self, customer_id):
+        return get_connection().execute(
+            "SELECT COUNT(*) FROM transactions WHERE customer_id = ? AND action = 'Overdue Penalty'",
+            (customer_id,)).fetchone()[0]
+
+    def test_one_penalty_per_interval(self):
+        self.add_entry(self.ana, 'Credit Added', 100.0, when=self.NOW - timedelta(days=40))
+
+        accounts = apply_overdue_penalties(self.NOW)
+        self.assertEqual([(a.customer_id, a.penalty_added) for a in accounts], [(self.ana, True)])
+        self.assertEqual(accounts[0].new_balance, 100.0 + PENALTY_AMOUNT)
+        self.assertIsNotNone(accounts[0].penalty_id)
+        self.assertBalance(self.ana, 100.0 + PENALTY_AMOUNT)
+
+        # Later the same day: still overdue, but the penalty is not due again
+        accounts = apply_overdue_penalties(self.NOW + timedelta(hours=3))
+        self.assertEqual([(a.penalty_added, a.days_since_penalty, a.penalty_id) for a in accounts],
+                         [(False, 0, None)])
+        self.assertEqual(self.penalties(self.ana), 1)
+        self.assertBalance(self.ana, 100.0 + PENALTY_AMOUNT)
+
+        apply_overdue_penalties(self.NOW + timedelta(days=30))
+        self.assertEqual(self.penalties(self.ana), 2)
+        self.assertBalance(self.ana, 100.0 + 2 * PENALTY_AMOUNT)
+
+    def test_both_credit_spellings_count(self):
+        ben = self.add_customer('Ben')
+        self.add_entry(self.ana, 'Credit Added', 50.0, when=self.NOW - timedelta(days=40))
+        self.add_entry(ben, 'Add Credit', 50.0, when=self.NOW - timedelta(days=40))
+
+        accounts = apply_overdue_penalties(self.NOW)
+        self.assertEqual(sorted(a.customer_id for a in accounts if a.penalty_added), sorted([self.ana, ben]))
+        self.assertBalance(ben, 50.0 + PENALTY_AMOUNT)
+
+    def test_recent_or_settled_accounts_are_not_overdue(self):
+        ben = self.add_customer('Ben')
+        self.add_entry(self.ana, 'Credit Added', 50.0, when=self.NOW - timedelta(days=10))
+        self.add_entry(ben, 'Credit Added', 50.0, when=self.NOW - timedelta(days=40))
+        self.add_entry(ben, 'Paid', 50.0, when=self.NOW - timedelta(days=35))
+
+        self.assertEqual(apply_overdue_penalties(self.NOW), [])
+        self.assertEqual(self.penalties(self.ana) + self.penalties(ben), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
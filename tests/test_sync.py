@@ -0,0 +1,192 @@
+"""Two devices syncing through the in-memory backend: round trips, deletes and live pulls."""
+import os
+import sys
+import tempfile
+import time
+import unittest
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import schema  # noqa: E402
+from database import get_connection, transaction  # noqa: E402
+from ledger import apply_balance_delta, balance_effect, ledger_balance, occurred_at  # noqa: E402
+from sync_backend import MemoryBackend  # noqa: E402
+from sync_engine import SyncEngine  # noqa: E402
+from sync_state import outbox_row_ids  # noqa: E402
+
+
+class TwoDeviceTest(unittest.TestCase):
+    """Devices A and B each get a database file; database.configure() switches between them."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self._original_path = database.DB_PATH
+        self.cloud = MemoryBackend()
+        self.engines = []
+        self.devices = {}
+        for name in ('a', 'b'):
+            self.devices[name] = os.path.join(self._tmp.name, f'{name}.db')
+            self.use(name)
+            schema.upgrade()
+
+    def tearDown(self):
+        for engine in self.engines:
+            engine.stop_listening()
+        database.close_connection()
+        database.configure(self._original_path)
+        self._tmp.cleanup()
+
+    def use(self, name):
+        database.configure(self.devices[name])
+
+    def sync(self, name, **kwargs):
+        self.use(name)
+        ok, message = SyncEngine(self.cloud).sync_all_data(**kwargs)
+        self.assertTrue(ok, message)
+
+    def add_customer(self, name):
+        now = datetime.now().isoformat()
+        customer_id = str(uuid.uuid4())
+        with transaction() as conn:
+            conn.execute('''INSERT INTO customers (id, name, display_name, balance, created_at, updated_at)
+                            VALUES (?, ?, ?, 0, ?, ?)''', (customer_id, name.lower(), name, now, now))
+        return customer_id
+
+    def add_entry(self, customer_id, action, amount):
+        now = datetime.now()
+        date, time_ = now.strftime('%Y-%m-%d'), now.strftime('%H:%M')
+        transaction_id = str(uuid.uuid4())
+        with transaction() as conn:
+            conn.execute('''INSERT INTO transactions (id, customer_id, date, time, occurred_at, action, product,
+                                                      quantity, amount, created_at, updated_at)
+                            VALUES (?, ?, ?, ?, ?, ?, 'Rice', 1, ?, ?, ?)''',
+                         (transaction_id, customer_id, date, time_, occurred_at(date, time_), action, amount,
+                          now.isoformat(), now.isoformat()))
+            apply_balance_delta(conn, customer_id, balance_effect(action, amount))
+        return transaction_id
+
+    def delete_entry(self, transaction_id):
+        with transaction() as conn:
+            customer_id, action, amount = conn.execute(
+                'SELECT customer_id, action, amount FROM transactions WHERE id = ?', (transaction_id,)).fetchone()
+            conn.execute('DELETE FROM transactions WHERE id = ?', (transaction_id,))
+            apply_balance_delta(conn, customer_id, -balance_effect(action, amount))
+
+    def ledger(self, name):
+        self.use(name)
+        conn = get_connection()
+        return (sorted(conn.execute('SELECT id, display_name, balance FROM customers')),
+                sorted(conn.execute('SELECT id, customer_id, action, amount FROM transactions WHERE is_deleted = 0')))
+
+    def outbox(self, name):
+        self.use(name)
+        return outbox_row_ids('customers'), outbox_row_ids('transactions')
+
+
+class RoundTripTest(TwoDeviceTest):
+    def test_changes_reach_the_other_device(self):
+        self.use('a')
+        ana = self.add_customer('Ana')
+        self.add_entry(ana, 'Credit Added', 100.0)
+        self.sync('a')
+        self.assertEqual(self.outbox('a'), (set(), set()))
+
+        self.sync('b')
+        self.assertEqual(self.ledger('b'), self.ledger('a'))
+
+        self.use('b')
+        self.add_entry(ana, 'Paid', 40.0)
+        self.sync('b')
+        self.sync('a')
+        customers, entries = self.ledger('a')
+        self.assertEqual(customers, [(ana, 'Ana', 60.0)])
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(self.ledger('a'), self.ledger('b'))
+
+    def test_failed_push_stays_queued(self):
+        self.use('a')
+        ana = self.add_customer('Ana')
+        entry = self.add_entry(ana, 'Credit Added', 100.0)
+        self.cloud.failure_rate = 1.0
+        ok, _ = SyncEngine(self.cloud).sync_all_data()
+        self.assertFalse(ok)
+        self.assertEqual(self.outbox('a'), ({ana}, {entry}))
+
+        self.cloud.failure_rate = 0.0
+        self.sync('a')
+        self.assertEqual(self.outbox('a'), (set(), set()))
+        self.assertEqual(len(self.cloud.documents('transactions')), 1)
+
+
+class DeleteTest(TwoDeviceTest):
+    def test_delete_reaches_the_cloud_and_the_other_device(self):
+        self.use('a')
+        ana = self.add_customer('Ana')
+        kept = self.add_entry(ana, 'Credit Added', 50.0)
+        gone = self.add_entry(ana, 'Credit Added', 100.0)
+        self.sync('a')
+        self.sync('b')
+
+        self.use('a')
+        self.delete_entry(gone)
+        # The pull before the push re-reads the deleted document (watermark overlap)
+        self.sync('a')
+        self.sync('b')
+
+        documents = self.cloud.documents('transactions')
+        self.assertEqual(sorted(data['local_id'] for data in documents.values() if not data.get('is_deleted')),
+                         [kept])
+        for name in ('a', 'b'):
+            customers, entries = self.ledger(name)
+            self.assertEqual([entry[0] for entry in entries], [kept], name)
+            self.assertEqual(customers, [(ana, 'Ana', 50.0)], name)
+            self.assertEqual(ledger_balance(get_connection(), ana), 50.0, name)
+
+    def test_resync_does_not_bring_back_an_unpushed_delete(self):
+        self.use('a')
+        ana = self.add_customer('Ana')
+        gone = self.add_entry(ana, 'Credit Added', 100.0)
+        self.sync('a')
+
+        self.delete_entry(gone)
+        self.sync('a', resync=True)
+        self.assertEqual(self.ledger('a')[1], [])
+        self.assertEqual([data.get('is_deleted') for data in self.cloud.documents('transactions').values()], [1])
+
+
+class ListenerTest(TwoDeviceTest):
+    def test_listener_applies_remote_changes(self):
+        self.use('b')
+        applied = []
+        engine = SyncEngine(self.cloud)
+        self.engines.append(engine)
+        self.assertTrue(engine.sync_all_data()[0])
+        self.assertTrue(engine.start_listening(post=lambda callback: callback(), on_applied=applied.append))
+        self.assertTrue(engine.listener.live)
+
+        # Another device's push; the transaction lands before its customer
+        now = datetime.now().isoformat()
+        batch = self.cloud.batch()
+        batch.set('transactions', 'T1', {
+            'customer_firebase_id': 'C1', 'date': '2026-10-17', 'time': '10:00', 'action': 'Credit Added',
+            'amount': 5.0, 'quantity': 1, 'created_at': now, 'updated_at': now, 'last_sync': now, 'local_id': 't1'})
+        batch.commit()
+        batch = self.cloud.batch()
+        batch.set('customers', 'C1', {
+            'name': 'ana', 'display_name': 'Ana', 'balance': 5.0, 'created_at': now, 'updated_at': now,
+            'last_sync': now, 'local_id': 'c1'})
+        batch.commit()
+
+        deadline = time.monotonic() + 5
+        while sum(applied) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(sum(applied), 2)
+        self.assertEqual(get_connection().execute('SELECT id, customer_id FROM transactions').fetchall(),
+                         [('t1', 'c1')])
+
+
+if __name__ == '__main__':
+    unittest.main()
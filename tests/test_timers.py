@@ -0,0 +1,150 @@
+"""Timer logic of the UI-side helpers, driven by a fake clock instead of a toolkit."""
+import os
+import queue
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search import SearchController  # noqa: E402
+from sync_worker import JobScheduler  # noqa: E402
+
+
+class FakeClock:
+    """schedule/cancel callables like Clock.schedule_once or Tk's after; advance() fires what falls due."""
+
+    def __init__(self):
+        self.now = 0.0
+        self._timers = {}  # handle -> (due, callback)
+        self._handles = 0
+
+    def schedule(self, delay, callback):
+        self._handles += 1
+        self._timers[self._handles] = (self.now + delay, callback)
+        return self._handles
+
+    def cancel(self, handle):
+        self._timers.pop(handle, None)
+
+    def pending(self):
+        return sorted(due for due, _ in self._timers.values())
+
+    def advance(self, seconds):
+        end = self.now + seconds
+        while True:
+            due = [(when, handle) for handle, (when, _) in self._timers.items() if when <= end]
+            if not due:
+                break
+            when, handle = min(due)
+            self.now = when
+            _, callback = self._timers.pop(handle)
+            callback(0)
+        self.now = end
+
+
+class JobSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.runs = []
+        self.scheduler = JobScheduler(self.clock.schedule, self.clock.cancel, jitter=0)
+        self.scheduler.add('sync', lambda: self.runs.append(self.clock.now), 300, first_delay=10)
+
+    def test_runs_on_its_interval_with_one_timer(self):
+        self.assertEqual(self.clock.pending(), [10])
+        self.clock.advance(1000)
+        self.assertEqual(self.runs, [10, 310, 610, 910])
+        self.assertEqual(self.clock.pending(), [1210])
+
+    def test_trigger_moves_the_timer_earlier(self):
+        self.clock.advance(10)
+        self.scheduler.trigger('sync', 2)
+        self.assertEqual(self.clock.pending(), [12])
+        self.clock.advance(2)
+        self.assertEqual(self.runs, [10, 12])
+        # The chain continues from the triggered run
+        self.assertEqual(self.clock.pending(), [312])
+
+    def test_burst_of_triggers_collapses_into_one_run(self):
+        self.clock.advance(10)
+        for _ in range(20):
+            self.scheduler.trigger('sync', 2)
+            self.clock.advance(0.5)
+        self.assertEqual(self.clock.pending(), [21.5])
+        self.clock.advance(2)
+        self.assertEqual(self.runs, [10, 21.5])
+
+    def test_failing_job_keeps_its_schedule(self):
+        def fail():
+            raise RuntimeError('offline')
+        self.scheduler.add('cleanup', fail, 60)
+        self.clock.advance(130)
+        self.assertEqual(sorted(self.clock.pending()), [180, 310])
+
+    def test_stop_cancels_every_timer(self):
+        self.scheduler.stop()
+        self.assertEqual(self.clock.pending(), [])
+
+
+class SearchControllerTest(unittest.TestCase):
+    """Queries run on the controller's worker; post() hands results back to this (UI) thread."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.posted = queue.Queue()
+        self.queries = []
+        self.applied = []
+        self.started = threading.Event()
+        self.release = {}  # text -> Event the query waits on
+        self.controller = SearchController(self.query, self.applied.append, self.clock.schedule, self.clock.cancel,
+                                           self.posted.put, delay=0.25)
+
+    def query(self, text):
+        self.queries.append(text)
+        if text in self.release:
+            self.started.set()
+            self.release[text].wait(5)
+        return [text.upper()]
+
+    def deliver(self, expected=1):
+        """Run the next expected posted callbacks on this thread, as the UI loop would."""
+        for _ in range(expected):
+            self.posted.get(timeout=5)(0)
+
+    def test_keystrokes_inside_the_window_run_one_query(self):
+        for text in ('a', 'an', 'ana'):
+            self.controller.submit(text)
+            self.clock.advance(0.1)
+        self.assertEqual(self.clock.pending(), [0.45])
+        self.clock.advance(0.25)
+        self.deliver()
+        self.assertEqual(self.queries, ['ana'])
+        self.assertEqual(self.applied, [['ANA']])
+
+    def test_stale_result_is_not_applied(self):
+        self.release['an'] = threading.Event()
+        self.controller.submit('an')
+        self.clock.advance(0.25)
+        self.assertTrue(self.started.wait(5))
+        # 'an' is running on the worker when the user types on
+        self.controller.submit('ana')
+        self.release['an'].set()
+        self.deliver()
+        self.assertEqual(self.applied, [])
+
+        self.clock.advance(0.25)
+        self.deliver()
+        self.assertEqual(self.queries, ['an', 'ana'])
+        self.assertEqual(self.applied, [['ANA']])
+
+    def test_cancel_drops_a_pending_search(self):
+        self.controller.submit('ana')
+        self.controller.cancel()
+        self.assertEqual(self.clock.pending(), [])
+        self.clock.advance(1)
+        self.assertTrue(self.posted.empty())
+        self.assertEqual(self.queries, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,10 +2,25 @@ import uuid
 from datetime import datetime, timedelta
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
-import sqlite3
-import os
 import re
-import sys
+
+import database
+from database import get_connection, transaction
+from ledger import (DASHBOARD_PAGE_SIZE, LEDGER_PAGE_SIZE, apply_balance_delta, apply_overdue_penalties,
+                    balance_effect, format_last_transaction, get_dashboard_page, get_dashboard_rows,
+                    get_ledger_page, occurred_at)
+import schema
+from search import NameIndex, SearchController
+from sync_state import forget_outbox
+from sync_worker import JobScheduler, SyncWorker
+
+# Periodic jobs, in seconds; each run is jittered so clients do not hit Firestore in lockstep
+SYNC_INTERVAL = 300
+CLEANUP_INTERVAL = 1800
+REMINDER_INTERVAL = 6 * 3600
+
+# A write asks for a sync this long after it; further writes in the window share that sync
+WRITE_SYNC_DELAY = 2
 
 
 def generate_id():
@@ -120,13 +135,16 @@ class AutocompleteEntry(ttk.Entry):
         self.update_suggestions()
 
     def update_suggestions(self):
-        typed = self.var.get().lower()
-        if not typed:
+        typed = self.var.get()
+        if not typed.strip():
             self.hide_listbox()
             return
 
-        # Filter suggestions based on input
-        self.suggestions = [name for name in self.app.all_borrowers if typed in name.lower()]
+        # Top matches straight from the app's name index
+        suggestions = self.app.name_index.search(typed, limit=8)
+        if suggestions == self.suggestions and self.suggestion_window.winfo_viewable():
+            return
+        self.suggestions = suggestions
 
         if self.suggestions:
             self.show_suggestions()
@@ -257,6 +275,13 @@ class UtangTrackerApp:
         # Create a StringVar to track changes to the search entry
         self.search_var = tk.StringVar()
         self.search_var.trace("w", self.on_search_change)
+        # Debounces keystrokes; queries run off the UI thread and only the latest result is shown
+        self.search_controller = SearchController(
+            query=self.query_table,
+            apply=lambda result: self.populate_table(*result),
+            schedule=lambda delay, callback: self.root.after(int(delay * 1000), callback),
+            cancel=self.root.after_cancel,
+            post=lambda callback: self.root.after(0, callback))
 
         self.search_entry = tk.Entry(search_frame, font=("Arial", 14), width=25, textvariable=self.search_var)
         self.search_entry.pack(side=tk.LEFT, padx=5)
@@ -286,8 +311,8 @@ class UtangTrackerApp:
                 entry.delete(0, tk.END)
                 entry.insert(0, "0")
             elif label == "Borrower:":
-                # Get all borrower names for autocomplete
-                self.all_borrowers = self.get_all_borrower_names()
+                # Index all borrower names for autocomplete
+                self.name_index = NameIndex(self.get_all_borrower_names())
                 entry = AutocompleteEntry(form_frame, self, font=("Arial", 14), width=25)
             else:
                 entry = tk.Entry(form_frame, font=("Arial", 14), width=25)
@@ -320,6 +345,18 @@ class UtangTrackerApp:
                                  font=("Arial", 14), width=18, height=2, bg="#FF9999", fg="white")
         reminder_btn.grid(row=0, column=4, padx=10, pady=10)
 
+        # Sync status indicator; sync itself runs on a worker thread
+        self.sync_status_var = tk.StringVar(value="Cloud sync: idle")
+        tk.Label(root, textvariable=self.sync_status_var, font=("Arial", 10),
+                 bg=self.current_bg_color, fg=self.current_fg_color).pack()
+        self.sync_worker = SyncWorker(
+            sync=self.run_sync_job,
+            post=lambda callback: self.root.after(0, callback),
+            on_start=lambda: self.sync_status_var.set("Cloud sync: syncing..."),
+            on_done=self.on_sync_done)
+        # Show the sync summary in a popup when the running sync was started by the Sync button
+        self.report_sync_result = False
+
         # Table frame with scrollbar
         self.table_frame = tk.Frame(root, bg=self.current_bg_color)
         self.table_frame.pack(pady=10, fill=tk.BOTH, expand=True)
@@ -331,7 +368,7 @@ class UtangTrackerApp:
         # Main table columns
         columns = ("Last Transaction", "Borrower", "Balance")
         self.tree = ttk.Treeview(self.table_frame, columns=columns, show="headings",
-                                 yscrollcommand=self.tree_scrollbar.set)
+                                 yscrollcommand=self.on_tree_scroll)
         self.tree_scrollbar.config(command=self.tree.yview)
 
         # Configure column headings and widths
@@ -358,307 +395,120 @@ class UtangTrackerApp:
         self.tree.pack(fill=tk.BOTH, expand=True)
         self.tree.bind("<Double-1>", self.on_double_click)
 
+        # Keyset cursor of the next dashboard page (None when everything is loaded)
+        self.next_page_after = None
+        self.loading_page = False
+        # Values currently shown per row; rows use the customer id as their iid
+        self.table_rows = {}
+
         # Initialize data
         self.refresh_table()
 
-        # Start the automatic sync cycle 5 seconds after the app launches
-        self.root.after(5000, self.auto_sync)
-
-        # ADD THIS LINE to check for reminders 2 seconds after startup
-        self.root.after(2000, self.check_startup_reminders)
+        # One timer per periodic job, however often a job is triggered
+        self.scheduler = JobScheduler(
+            schedule=lambda delay, callback: self.root.after(int(delay * 1000), callback),
+            cancel=self.root.after_cancel)
+        self.scheduler.add('reminders', self.check_startup_reminders, REMINDER_INTERVAL, first_delay=2)
+        self.scheduler.add('sync', self.auto_sync, SYNC_INTERVAL, first_delay=5)
+        self.scheduler.add('cleanup', self.auto_delete_zero_balance, CLEANUP_INTERVAL, first_delay=10)
+        self.start_live_sync()
 
     def auto_delete_zero_balance(self):
         """Automatically delete customers with zero balance for more than 1 week"""
         print("Checking for zero balance customers to delete...")
-        conn = self.get_db_connection()
+        deleted_count = 0
 
         try:
-            cursor = conn.cursor()
+            with transaction() as conn:
+                cursor = conn.cursor()
 
-            # Calculate date 1 week ago
-            one_week_ago = (datetime.now() - timedelta(days=7)).isoformat()
-
-            # Find customers with zero balance and no transactions in the last week
-            cursor.execute("""
-                SELECT c.id, c.display_name 
-                FROM customers c
-                WHERE c.balance = 0 
-                AND c.updated_at < ?
-                AND NOT EXISTS (
-                    SELECT 1 FROM transactions t 
-                    WHERE t.customer_id = c.id 
-                    AND t.created_at > ?
-                )
-            """, (one_week_ago, one_week_ago))
+                # Calculate date 1 week ago
+                one_week_ago = (datetime.now() - timedelta(days=7)).isoformat()
+
+                # Find customers with zero balance and no transactions in the last week
+                cursor.execute("""
+                    SELECT c.id, c.display_name 
+                    FROM customers c
+                    WHERE c.balance = 0 
+                    AND c.updated_at < ?
+                    AND NOT EXISTS (
+                        SELECT 1 FROM transactions t 
+                        WHERE t.customer_id = c.id 
+                        AND t.created_at > ?
+                    )
+                """, (one_week_ago, one_week_ago))
 
-            customers_to_delete = cursor.fetchall()
+                customers_to_delete = cursor.fetchall()
+                deleted_names = [display_name for customer_id, display_name in customers_to_delete]
 
-            if customers_to_delete:
-                deleted_count = 0
                 for customer_id, display_name in customers_to_delete:
-                    # Delete customer and their transactions
+                    # Delete customer and their transactions; this is local cleanup, so
+                    # the cloud keeps its copies and the outbox does not push the deletes
+                    transaction_ids = [row[0] for row in cursor.execute(
+                        'SELECT id FROM transactions WHERE customer_id = ?', (customer_id,))]
                     cursor.execute('DELETE FROM transactions WHERE customer_id = ?', (customer_id,))
                     cursor.execute('DELETE FROM customers WHERE id = ?', (customer_id,))
+                    forget_outbox(conn, 'transactions', transaction_ids)
+                    forget_outbox(conn, 'customers', [customer_id])
                     print(f"Auto-deleted customer: {display_name}")
                     deleted_count += 1
 
-                conn.commit()
-                print(f"Auto-deleted {deleted_count} customers with zero balance")
-
-                # Refresh table if any were deleted
-                if deleted_count > 0:
-                    self.refresh_table()
-
         except Exception as e:
-            conn.rollback()
             print(f"Error in auto-delete: {e}")
-        finally:
-            conn.close()
+            return
+
+        if deleted_count > 0:
+            print(f"Auto-deleted {deleted_count} customers with zero balance")
+            for display_name in deleted_names:
+                self.name_index.remove(display_name)
+            # Refresh table if any were deleted
+            self.refresh_table()
 
     def check_startup_reminders(self):
         """Check for reminders at startup - adds ₱3 penalty monthly and shows popup if there are overdue debts"""
         print("Checking for overdue accounts at startup...")
-        conn = self.get_db_connection()
-        overdue_customers = []
-        penalty_added = False
-
-        try:
-            cursor = conn.cursor()
-
-            # Calculate the date 30 days ago (but set to 1 day for testing)
-            thirty_days_ago = (datetime.now() - timedelta(days=30)).isoformat()
-            today = datetime.now().strftime("%Y-%m-%d")
-
-            # Find all customers with a balance > 0
-            cursor.execute("SELECT id, display_name, balance FROM customers WHERE balance > 0")
-            customers_with_balance = cursor.fetchall()
-
-            for customer_id, display_name, balance in customers_with_balance:
-                # For each customer, find the date of their oldest credit transaction
-                cursor.execute("""
-                    SELECT MIN(created_at) FROM transactions 
-                    WHERE customer_id = ? AND action = 'Credit Added'
-                """, (customer_id,))
-                result = cursor.fetchone()
-                oldest_credit_date_str = result[0] if result else None
-
-                # If they have a credit and it's older than 30 days (1 day for testing)
-                if oldest_credit_date_str and oldest_credit_date_str < thirty_days_ago:
-                    # MONTHLY PENALTY LOGIC: Check last penalty date
-                    cursor.execute("""
-                        SELECT MAX(date) FROM transactions 
-                        WHERE customer_id = ? AND action = 'Overdue Penalty'
-                    """, (customer_id,))
-                    last_penalty_result = cursor.fetchone()
-                    last_penalty_date = last_penalty_result[0] if last_penalty_result[0] else None
-
-                    # Add penalty if never penalized or last penalty was more than 30 days ago
-                    should_add_penalty = True
-                    penalty_status = "new monthly penalty"
-
-                    if last_penalty_date:
-                        try:
-                            last_penalty_datetime = datetime.strptime(last_penalty_date, "%Y-%m-%d")
-                            days_since_last_penalty = (datetime.now() - last_penalty_datetime).days
-                            should_add_penalty = days_since_last_penalty >= 30
-
-                            if not should_add_penalty:
-                                penalty_status = f"penalty added {days_since_last_penalty} days ago"
-                        except ValueError:
-                            # If date parsing fails, add penalty
-                            should_add_penalty = True
-                            penalty_status = "new monthly penalty"
-
-                    if should_add_penalty:
-                        # Add ₱3 penalty
-                        penalty_amount = 3.0
-                        new_balance = balance + penalty_amount
-
-                        # Update customer balance
-                        cursor.execute(
-                            'UPDATE customers SET balance = ?, updated_at = ?, sync_status = ? WHERE id = ?',
-                            (new_balance, datetime.now().isoformat(), 'pending', customer_id)
-                        )
-
-                        # Create penalty transaction
-                        transaction_id = str(uuid.uuid4())
-                        now = datetime.now().isoformat()
-                        cursor.execute(
-                            '''INSERT INTO transactions 
-                            (id, customer_id, date, time, action, product, quantity, amount, created_at, updated_at, sync_status) 
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                            (transaction_id, customer_id,
-                             today,
-                             datetime.now().strftime("%H:%M"),
-                             "Overdue Penalty", "Late Fee", 1, penalty_amount,
-                             now, now, 'pending')
-                        )
-
-                        overdue_customers.append((display_name, balance, new_balance, penalty_status))
-                        penalty_added = True
-                    else:
-                        # Penalty already added recently, but still show as overdue
-                        overdue_customers.append((display_name, balance, balance, penalty_status))
-
-            if penalty_added:
-                conn.commit()
-
-        except Exception as e:
-            conn.rollback()
-            print(f"Error checking for startup reminders: {e}")
-        finally:
-            conn.close()
-
-        # Refresh table to show updated balances
-        self.refresh_table()
+        message = self.run_overdue_check()
 
         # ONLY show popup at startup if there are overdue customers
-        if overdue_customers:
-            message = "Overdue Accounts:\n\n"
-            for name, old_balance, new_balance, status in overdue_customers:
-                if status == "new monthly penalty":
-                    message += f"- {name}: ₱{old_balance:.2f} → ₱{new_balance:.2f} (₱3 monthly penalty added)\n"
-                else:
-                    message += f"- {name}: ₱{new_balance:.2f} ({status})\n"
+        if message:
             messagebox.showwarning("Overdue Accounts Reminder", message)
-        # No else clause - if no overdue debts, don't show any popup at startup
 
     def check_for_reminders(self):
         """Checks for borrowers with debts older than 30 days, adds ₱3 penalty monthly, and shows a reminder."""
         print("Checking for overdue accounts...")
-        conn = self.get_db_connection()
-        overdue_customers = []
-        penalty_added = False
-
-        try:
-            cursor = conn.cursor()
-
-            # Calculate the date 30 days ago (but set to 1 day for testing)
-            thirty_days_ago = (datetime.now() - timedelta(days=30)).isoformat()  # TESTING: changed from 30 to 1
-            today = datetime.now().strftime("%Y-%m-%d")
-            print(f"DEBUG: Looking for transactions older than: {thirty_days_ago}")
-
-            # Find all customers with a balance > 0
-            cursor.execute("SELECT id, display_name, balance FROM customers WHERE balance > 0")
-            customers_with_balance = cursor.fetchall()
-            print(f"DEBUG: Found {len(customers_with_balance)} customers with balance > 0")
-
-            for customer_id, display_name, balance in customers_with_balance:
-                print(f"DEBUG: Checking customer: {display_name}, Balance: {balance}")
-
-                # For each customer, find the date of their oldest credit transaction
-                cursor.execute("""
-                    SELECT MIN(created_at) FROM transactions 
-                    WHERE customer_id = ? AND action = 'Credit Added'
-                """, (customer_id,))
-                result = cursor.fetchone()
-                oldest_credit_date_str = result[0] if result else None
-                print(f"DEBUG: {display_name} - Oldest credit date: {oldest_credit_date_str}")
-
-                # If they have a credit and it's older than 30 days (1 day for testing)
-                if oldest_credit_date_str and oldest_credit_date_str < thirty_days_ago:
-                    print(f"DEBUG: {display_name} - Account is overdue!")
-
-                    # MONTHLY PENALTY LOGIC: Check last penalty date
-                    cursor.execute("""
-                        SELECT MAX(date) FROM transactions 
-                        WHERE customer_id = ? AND action = 'Overdue Penalty'
-                    """, (customer_id,))
-                    last_penalty_result = cursor.fetchone()
-                    last_penalty_date = last_penalty_result[0] if last_penalty_result[0] else None
-
-                    # Add penalty if never penalized or last penalty was more than 30 days ago
-                    should_add_penalty = True
-                    penalty_status = "new monthly penalty"
-
-                    if last_penalty_date:
-                        try:
-                            last_penalty_datetime = datetime.strptime(last_penalty_date, "%Y-%m-%d")
-                            days_since_last_penalty = (datetime.now() - last_penalty_datetime).days
-                            should_add_penalty = days_since_last_penalty >= 30
-                            print(
-                                f"DEBUG: {display_name} - Days since last penalty: {days_since_last_penalty}, Should add penalty: {should_add_penalty}")
-
-                            if not should_add_penalty:
-                                penalty_status = f"penalty added {days_since_last_penalty} days ago"
-                        except ValueError as e:
-                            print(f"DEBUG: Error parsing date {last_penalty_date}: {e}")
-                            # If date parsing fails, add penalty
-                            should_add_penalty = True
-                            penalty_status = "new monthly penalty"
-
-                    if should_add_penalty:
-                        # Add ₱3 penalty
-                        penalty_amount = 3.0
-                        new_balance = balance + penalty_amount
-                        print(f"DEBUG: Adding ₱3 monthly penalty to {display_name}")
-
-                        # Update customer balance
-                        cursor.execute(
-                            'UPDATE customers SET balance = ?, updated_at = ?, sync_status = ? WHERE id = ?',
-                            (new_balance, datetime.now().isoformat(), 'pending', customer_id)
-                        )
-
-                        # Create penalty transaction
-                        transaction_id = str(uuid.uuid4())
-                        now = datetime.now().isoformat()
-                        cursor.execute(
-                            '''INSERT INTO transactions 
-                            (id, customer_id, date, time, action, product, quantity, amount, created_at, updated_at, sync_status) 
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                            (transaction_id, customer_id,
-                             today,
-                             datetime.now().strftime("%H:%M"),
-                             "Overdue Penalty", "Late Fee", 1, penalty_amount,
-                             now, now, 'pending')
-                        )
+        message = self.run_overdue_check()
 
-                        overdue_customers.append((display_name, balance, new_balance, penalty_status))
-                        penalty_added = True
-                    else:
-                        # Penalty already added recently, but still show as overdue
-                        print(f"DEBUG: Monthly penalty already added recently for {display_name}")
-                        overdue_customers.append((display_name, balance, balance, penalty_status))
-                else:
-                    print(f"DEBUG: {display_name} - Account is NOT overdue")
-
-            if penalty_added:
-                conn.commit()
-                print("DEBUG: Monthly penalties committed to database")
+        if message:
+            messagebox.showwarning("Overdue Accounts Reminder", message)
+        else:
+            messagebox.showinfo("Reminders", "No overdue account found!")
 
+    def run_overdue_check(self):
+        """Add due penalties and return the reminder text ('' when nobody is overdue)"""
+        overdue_accounts = []
+        try:
+            overdue_accounts = apply_overdue_penalties()
         except Exception as e:
-            conn.rollback()
             print(f"Error checking for reminders: {e}")
-        finally:
-            conn.close()
 
         # Refresh table to show updated balances
         self.refresh_table()
 
-        print(f"DEBUG: Overdue customers found: {len(overdue_customers)}")
-
-        # If we found any overdue customers, show the pop-up
-        if overdue_customers:
-            message = "Overdue Accounts:\n\n"
-            for name, old_balance, new_balance, status in overdue_customers:
-                if status == "new monthly penalty":
-                    message += f"- {name}: ₱{old_balance:.2f} → ₱{new_balance:.2f} (₱3 monthly penalty added)\n"
-                else:
-                    message += f"- {name}: ₱{new_balance:.2f} ({status})\n"
-            print("DEBUG: Showing popup with overdue accounts")
-            messagebox.showwarning("Overdue Accounts Reminder", message)
-        else:
-            print("DEBUG: No overdue accounts found, showing 'no overdue' popup")
-            messagebox.showinfo("Reminders", "No overdue account found!")
+        if not overdue_accounts:
+            return ""
+        message = "Overdue Accounts:\n\n"
+        for account in overdue_accounts:
+            if account.penalty_added:
+                message += f"- {account.name}: ₱{account.old_balance:.2f} → ₱{account.new_balance:.2f} (₱3 monthly penalty added)\n"
+            else:
+                message += f"- {account.name}: ₱{account.new_balance:.2f} (penalty added {account.days_since_penalty} days ago)\n"
+        return message
 
     def get_all_borrower_names(self):
         """Get all unique borrower names for autocomplete"""
-        conn = self.get_db_connection()
-        cursor = conn.cursor()
+        cursor = get_connection().cursor()
         cursor.execute('SELECT DISTINCT display_name FROM customers WHERE balance >= 0 ORDER BY display_name')
-        borrowers = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        return borrowers
+        return [row[0] for row in cursor.fetchall()]
 
     def toggle_search_mode(self):
         """Toggle between search mode and normal mode"""
@@ -679,6 +529,7 @@ class UtangTrackerApp:
             self.search_button.config(text="Search", bg=self.button_bg)
             self.search_entry.config(state='disabled')
             self.search_var.set("")
+            self.search_controller.cancel()
             # Enable form fields and buttons
             for label, widget in self.entries.items():
                 if label != "Clear":
@@ -706,208 +557,32 @@ class UtangTrackerApp:
             self.refresh_table()
 
     def init_db(self):
-        """Initialize the SQLite database with sync fields"""
-        if getattr(sys, 'frozen', False):
-            app_dir = os.path.dirname(sys.executable)
-        else:
-            app_dir = os.path.dirname(os.path.abspath(__file__))
-
-        data_dir = os.path.join(app_dir, 'data')
-        os.makedirs(data_dir, exist_ok=True)
-
-        db_path = os.path.join(data_dir, 'utracker.db')
-
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        # First, check if we need to migrate the schema
-        cursor.execute("PRAGMA table_info(customers)")
-        columns = [col[1] for col in cursor.fetchall()]
-
-        # Check if this is the old schema (missing sync fields)
-        needs_migration = 'sync_status' not in columns
-
-        if needs_migration:
-            print("Migrating database to new schema...")
-            self._migrate_database(conn, cursor)
-        else:
-            print("Database already uses new schema")
-
-        # Create indexes only if they don't exist
-        try:
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_customer_name ON customers (name)')
-        except:
-            pass
-
-        try:
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_sync_status ON customers (sync_status)')
-        except:
-            pass
-
-        try:
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_tx_sync_status ON transactions (sync_status)')
-        except:
-            pass
-
-        conn.commit()
-        conn.close()
-        return db_path
-
-    def _migrate_database(self, conn, cursor):
-        """Migrate from old schema to new schema with sync fields"""
-        try:
-            # Backup old tables
-            cursor.execute("ALTER TABLE customers RENAME TO customers_old")
-            cursor.execute("ALTER TABLE transactions RENAME TO transactions_old")
-
-            # Create new tables with sync fields
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS customers (
-                id TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                display_name TEXT NOT NULL,
-                phone_number TEXT,
-                balance REAL NOT NULL DEFAULT 0,
-                created_at TEXT NOT NULL,
-                updated_at TEXT NOT NULL,
-                sync_status TEXT DEFAULT 'pending',
-                firebase_id TEXT
-            )
-            ''')
-
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS transactions (
-                id TEXT PRIMARY KEY,
-                customer_id TEXT NOT NULL,
-                date TEXT NOT NULL,
-                time TEXT NOT NULL,
-                action TEXT NOT NULL,
-                product TEXT,
-                quantity INTEGER NOT NULL DEFAULT 0,
-                amount REAL NOT NULL,
-                actual_borrower TEXT,
-                created_at TEXT NOT NULL,
-                updated_at TEXT NOT NULL,
-                sync_status TEXT DEFAULT 'pending',
-                firebase_id TEXT,
-                FOREIGN KEY (customer_id) REFERENCES customers (id)
-            )
-            ''')
-
-            # Migrate customers data
-            cursor.execute('SELECT id, name, display_name, phone_number, balance FROM customers_old')
-            old_customers = cursor.fetchall()
-
-            for old_id, name, display_name, phone_number, balance in old_customers:
-                # Convert old integer ID to string UUID if needed
-                if isinstance(old_id, int):
-                    new_id = str(uuid.uuid4())
-                else:
-                    new_id = old_id
-
-                now = datetime.now().isoformat()
-                cursor.execute('''
-                    INSERT INTO customers 
-                    (id, name, display_name, phone_number, balance, created_at, updated_at, sync_status)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (new_id, name, display_name, phone_number, balance, now, now, 'synced'))
-
-                # Update transactions to use new customer ID if ID changed
-                if isinstance(old_id, int):
-                    cursor.execute('UPDATE transactions_old SET customer_id = ? WHERE customer_id = ?',
-                                   (new_id, old_id))
-
-            # Migrate transactions data
-            cursor.execute('''
-                SELECT id, customer_id, date, time, action, product, quantity, amount, actual_borrower 
-                FROM transactions_old
-            ''')
-            old_transactions = cursor.fetchall()
-
-            for (old_id, customer_id, date, time, action, product, quantity,
-                 amount, actual_borrower) in old_transactions:
-
-                if isinstance(old_id, int):
-                    new_id = str(uuid.uuid4())
-                else:
-                    new_id = old_id
-
-                now = datetime.now().isoformat()
-                cursor.execute('''
-                    INSERT INTO transactions
-                    (id, customer_id, date, time, action, product, quantity, amount, 
-                     actual_borrower, created_at, updated_at, sync_status)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (new_id, customer_id, date, time, action, product, quantity,
-                      amount, actual_borrower, now, now, 'synced'))
-
-            # Drop old tables
-            cursor.execute("DROP TABLE customers_old")
-            cursor.execute("DROP TABLE transactions_old")
-
-            print("Database migration completed successfully!")
-
-        except Exception as e:
-            # If migration fails, restore old tables
-            try:
-                cursor.execute("DROP TABLE IF EXISTS customers")
-                cursor.execute("DROP TABLE IF EXISTS transactions")
-                cursor.execute("ALTER TABLE customers_old RENAME TO customers")
-                cursor.execute("ALTER TABLE transactions_old RENAME TO transactions")
-            except:
-                pass
-            raise e
-
-    def get_db_connection(self):
-        if getattr(sys, 'frozen', False):
-            app_dir = os.path.dirname(sys.executable)
-        else:
-            app_dir = os.path.dirname(os.path.abspath(__file__))
-
-        db_path = os.path.join(app_dir, 'data', 'utracker.db')
-        return sqlite3.connect(db_path)
+        """Bring the database up to the current schema (see schema.py)"""
+        schema.upgrade()
+        return database.DB_PATH
 
     def get_customer_id(self, name, actual_borrower=None):
-        conn = self.get_db_connection()
-        cursor = conn.cursor()
+        with transaction() as conn:
+            cursor = conn.cursor()
 
-        name_lower = name.lower()
-        cursor.execute('SELECT id, display_name FROM customers WHERE name = ?', (name_lower,))
-        result = cursor.fetchone()
+            name_lower = name.lower()
+            cursor.execute('SELECT id, display_name FROM customers WHERE name = ?', (name_lower,))
+            result = cursor.fetchone()
 
-        if result:
-            customer_id, display_name = result
-        else:
-            # Create new customer with UUID and timestamps
-            customer_id = str(uuid.uuid4())
-            now = datetime.now().isoformat()
-            cursor.execute(
-                'INSERT INTO customers (id, name, display_name, balance, created_at, updated_at, sync_status) VALUES (?, ?, ?, 0, ?, ?, ?)',
-                (customer_id, name_lower, name, now, now, 'pending')
-            )
-            conn.commit()
-            display_name = name
+            if result:
+                customer_id, display_name = result
+            else:
+                # Create new customer with UUID and timestamps
+                customer_id = str(uuid.uuid4())
+                now = datetime.now().isoformat()
+                cursor.execute(
+                    'INSERT INTO customers (id, name, display_name, balance, created_at, updated_at, sync_status) VALUES (?, ?, ?, 0, ?, ?, ?)',
+                    (customer_id, name_lower, name, now, now, 'pending')
+                )
+                display_name = name
 
-        conn.close()
         return customer_id, display_name
 
-    def get_latest_transaction_datetime(self, customer_id):
-        conn = self.get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            'SELECT date, time FROM transactions WHERE customer_id = ? ORDER BY date DESC, time DESC LIMIT 1',
-            (customer_id,)
-        )
-        result = cursor.fetchone()
-
-        conn.close()
-        if result:
-            date, time = result
-            dt = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
-            return dt.strftime("%Y-%m-%d %I:%M %p")
-        return "N/A"
-
     def add_utang(self):
         borrower_name = self.entries["Borrower:"].get().strip()
         co_borrower = self.entries["Co-borrower:"].get().strip()
@@ -941,43 +616,36 @@ class UtangTrackerApp:
 
         total_amount = amount * quantity
 
-        conn = self.get_db_connection()
-        cursor = conn.cursor()
-
         try:
-            customer_id, display_name = self.get_customer_id(borrower_name)
-
-            # Update customer balance
-            cursor.execute(
-                'UPDATE customers SET balance = balance + ?, updated_at = ?, sync_status = ? WHERE id = ?',
-                (total_amount, datetime.now().isoformat(), 'pending', customer_id)
-            )
+            with transaction() as conn:
+                cursor = conn.cursor()
+                customer_id, display_name = self.get_customer_id(borrower_name)
 
-            # Create transaction with new schema - CHANGED: "Add Credit" to "Credit Added"
-            transaction_id = str(uuid.uuid4())
-            now = datetime.now().isoformat()
-            cursor.execute(
-                '''INSERT INTO transactions 
-                (id, customer_id, date, time, action, product, quantity, amount, actual_borrower, created_at, updated_at, sync_status) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                (
-                    transaction_id, customer_id, date, time, "Credit Added",
-                    product, quantity, total_amount,
-                    co_borrower if co_borrower and co_borrower != display_name else None,
-                    now, now, 'pending'
+                # Create transaction with new schema - CHANGED: "Add Credit" to "Credit Added"
+                transaction_id = str(uuid.uuid4())
+                now = datetime.now().isoformat()
+                cursor.execute(
+                    '''INSERT INTO transactions 
+                    (id, customer_id, date, time, occurred_at, action, product, quantity, amount, actual_borrower, created_at, updated_at, sync_status) 
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                    (
+                        transaction_id, customer_id, date, time, occurred_at(date, time), "Credit Added",
+                        product, quantity, total_amount,
+                        co_borrower if co_borrower and co_borrower != display_name else None,
+                        now, now, 'pending'
+                    )
                 )
-            )
 
-            conn.commit()
+                # Update customer balance
+                apply_balance_delta(conn, customer_id, total_amount, now)
+
+            self.name_index.add(display_name)
             self.refresh_table()
             self.clear_fields()
-            self.auto_sync()
+            self.scheduler.trigger('sync', WRITE_SYNC_DELAY)
 
         except Exception as e:
-            conn.rollback()
             messagebox.showerror("Database Error", f"An error occurred: {str(e)}")
-        finally:
-            conn.close()
 
     def record_payment(self):
         borrower_name = self.entries["Borrower:"].get().strip()
@@ -994,139 +662,140 @@ class UtangTrackerApp:
             messagebox.showerror("Input Error", "Please enter a valid amount.")
             return
 
-        conn = self.get_db_connection()
-        cursor = conn.cursor()
+        # Look the customer up before taking the write lock, which must not be held while a dialog is open
+        result = get_connection().execute('SELECT id, display_name, balance FROM customers WHERE name = ?',
+                                          (borrower_name.lower(),)).fetchone()
+        if not result:
+            messagebox.showerror("Error", "Customer not found.")
+            return
+        customer_id, display_name, balance = result
 
         try:
-            cursor.execute('SELECT id, display_name, balance FROM customers WHERE name = ?', (borrower_name.lower(),))
-            result = cursor.fetchone()
-
-            if not result:
-                messagebox.showerror("Error", "Customer not found.")
-                return
-
-            customer_id, display_name, balance = result
+            with transaction() as conn:
+                cursor = conn.cursor()
+                now = datetime.now().isoformat()
 
-            new_balance = balance - amount
+                # Create transaction with UUID and sync fields - CHANGED: "Record Payment" to "Paid"
+                transaction_id = str(uuid.uuid4())
+                cursor.execute(
+                    '''INSERT INTO transactions 
+                    (id, customer_id, date, time, occurred_at, action, product, quantity, amount, created_at, updated_at, sync_status) 
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                    (transaction_id, customer_id, date, time, occurred_at(date, time), "Paid", "N/A", 0, amount, now, now, 'pending')
+                )
 
-            # Update customer balance with sync fields
-            now = datetime.now().isoformat()
-            cursor.execute(
-                'UPDATE customers SET balance = ?, updated_at = ?, sync_status = ? WHERE id = ?',
-                (new_balance, now, 'pending', customer_id)
-            )
+                # Update customer balance with sync fields
+                apply_balance_delta(conn, customer_id, -amount, now)
 
-            # Create transaction with UUID and sync fields - CHANGED: "Record Payment" to "Paid"
-            transaction_id = str(uuid.uuid4())
-            cursor.execute(
-                '''INSERT INTO transactions 
-                (id, customer_id, date, time, action, product, quantity, amount, created_at, updated_at, sync_status) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                (transaction_id, customer_id, date, time, "Paid", "N/A", 0, amount, now, now, 'pending')
-            )
-
-            conn.commit()
             self.clear_fields()
 
             # REMOVED: No longer prompt to remove when balance reaches zero
             # The customer will simply stay in the list with zero balance
 
             self.refresh_table()
-            self.auto_sync()
+            self.scheduler.trigger('sync', WRITE_SYNC_DELAY)
 
         except Exception as e:
-            conn.rollback()
             messagebox.showerror("Database Error", f"An error occurred: {str(e)}")
             import traceback
             traceback.print_exc()  # This will print the full error to console
-        finally:
-            conn.close()
 
     def refresh_table(self, search_term=None):
-        self.tree.delete(*self.tree.get_children())
-
-        conn = self.get_db_connection()
-        cursor = conn.cursor()
-
+        # Reload as many rows as are loaded now so the scroll position survives
+        loaded = max(DASHBOARD_PAGE_SIZE, len(self.tree.get_children()))
         try:
-            if search_term:
-                cursor.execute(
-                    '''SELECT id, display_name, balance FROM customers 
-                    WHERE (name LIKE ? OR display_name LIKE ?) 
-                    AND balance >= 0 ORDER BY display_name''',
-                    (f'%{search_term.lower()}%', f'%{search_term}%')
-                )
-            else:
-                cursor.execute(
-                    'SELECT id, display_name, balance FROM customers WHERE balance >= 0 ORDER BY display_name'
-                )
+            rows, next_after = self.query_table(search_term, loaded)
+        except Exception as e:
+            messagebox.showerror("Database Error", f"An error occurred: {str(e)}")
+            return
+        self.populate_table(rows, next_after)
 
-            customers = cursor.fetchall()
+    def query_table(self, search_term=None, limit=DASHBOARD_PAGE_SIZE):
+        """Search results, or the first page of the full list; returns (rows, next_after)"""
+        if search_term:
+            return get_dashboard_rows(search_term), None
+        return get_dashboard_page(limit=limit)
 
-            # Calculate 30 days ago (PERMANENT)
-            thirty_days_ago = (datetime.now() - timedelta(days=30)).isoformat()
+    def table_values(self, row):
+        customer_id, display_name, balance, last_transaction, is_overdue = row
+        # Add warning emoji for overdue customers
+        display_name_with_indicator = display_name + " ⚠️" if is_overdue else display_name
+        return (last_transaction, display_name_with_indicator, f"₱{balance:.2f}")
 
-            for customer_id, display_name, balance in customers:
-                last_transaction = self.get_latest_transaction_datetime(customer_id)
+    def populate_table(self, rows, next_after=None):
+        """Bring the table in line with rows, touching only rows that were added, changed, moved or removed.
 
-                # Check if overdue - only for customers with balance > 0
-                is_overdue = False
-                if balance > 0:
-                    cursor.execute("""
-                        SELECT MIN(created_at) FROM transactions 
-                        WHERE customer_id = ? AND action = 'Credit Added'
-                    """, (customer_id,))
-                    result = cursor.fetchone()
-                    oldest_credit_date_str = result[0] if result else None
+        Rows keep their customer-id iid, so the selection and scroll position survive a refresh.
+        """
+        try:
+            wanted = {row[0]: self.table_values(row) for row in rows}
+            removed = [customer_id for customer_id in self.table_rows if customer_id not in wanted]
+            if removed:
+                self.tree.delete(*removed)
+            shown = [customer_id for customer_id in self.tree.get_children() if customer_id in wanted]
+
+            for index, row in enumerate(rows):
+                customer_id, values = row[0], wanted[row[0]]
+                if index < len(shown) and shown[index] == customer_id:
+                    if self.table_rows[customer_id] != values:
+                        self.tree.item(customer_id, values=values)
+                    continue
+                if customer_id in self.table_rows:
+                    self.tree.move(customer_id, "", index)
+                    self.tree.item(customer_id, values=values)
+                    shown.remove(customer_id)
+                else:
+                    self.tree.insert("", index, iid=customer_id, values=values)
+                shown.insert(index, customer_id)
+            self.table_rows = wanted
 
-                    is_overdue = (oldest_credit_date_str and
-                                  oldest_credit_date_str < thirty_days_ago)
+        except Exception as e:
+            messagebox.showerror("Database Error", f"An error occurred: {str(e)}")
+        self.next_page_after = next_after
 
-                # Add warning emoji for overdue customers
-                display_name_with_indicator = display_name + " ⚠️" if is_overdue else display_name
+    def append_rows(self, rows):
+        try:
+            for row in rows:
+                values = self.table_values(row)
+                self.tree.insert("", "end", iid=row[0], values=values)
+                self.table_rows[row[0]] = values
 
-                self.tree.insert("", "end", values=(
-                    last_transaction,
-                    display_name_with_indicator,
-                    f"₱{balance:.2f}"
-                ))
+        except Exception as e:
+            messagebox.showerror("Database Error", f"An error occurred: {str(e)}")
+
+    def on_tree_scroll(self, first, last):
+        """Keep the scrollbar in step and fetch the next page when the view nears the end"""
+        self.tree_scrollbar.set(first, last)
+        if float(last) > 0.9 and self.next_page_after is not None and not self.loading_page:
+            self.loading_page = True
+            self.root.after_idle(self.load_next_page)
 
+    def load_next_page(self):
+        try:
+            if self.next_page_after is None:
+                return
+            rows, next_after = get_dashboard_page(self.next_page_after)
+            self.append_rows(rows)
+            self.next_page_after = next_after
         except Exception as e:
             messagebox.showerror("Database Error", f"An error occurred: {str(e)}")
         finally:
-            conn.close()
+            self.loading_page = False
 
     def on_search_change(self, *args):
         if not self.search_mode:
             return
 
         search_term = self.search_var.get().strip()
-        self.refresh_table(search_term)
+        self.search_controller.submit(search_term)
 
     def on_double_click(self, event):
         selected_item = self.tree.selection()
         if not selected_item:
             return
 
-        display_name = self.tree.item(selected_item[0], "values")[1]
-
-        conn = self.get_db_connection()
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute('SELECT id FROM customers WHERE display_name = ?', (display_name,))
-            result = cursor.fetchone()
-
-            if result:
-                customer_id = result[0]
-                self.show_transaction_history(customer_id)
-            else:
-                messagebox.showerror("Error", "Customer not found.")
-
-        except Exception as e:
-            messagebox.showerror("Database Error", f"An error occurred: {str(e)}")
-        finally:
-            conn.close()
+        # Rows are keyed by customer id
+        self.show_transaction_history(selected_item[0])
 
     def show_transaction_history(self, customer_id):
         # Close any existing history window for this customer
@@ -1135,8 +804,7 @@ class UtangTrackerApp:
                 window.destroy()
                 self.open_windows.remove(window)
 
-        conn = self.get_db_connection()
-        cursor = conn.cursor()
+        cursor = get_connection().cursor()
 
         try:
             cursor.execute('SELECT display_name, phone_number FROM customers WHERE id = ?', (customer_id,))
@@ -1186,12 +854,13 @@ class UtangTrackerApp:
                         messagebox.showerror("Error", "Borrower name cannot be empty.")
                         return
 
-                    conn = self.get_db_connection()
-                    cursor = conn.cursor()
-                    cursor.execute('UPDATE customers SET display_name = ?, name = ? WHERE id = ?',
-                                   (new_name, new_name.lower(), customer_id))
-                    conn.commit()
-                    conn.close()
+                    with transaction() as conn:
+                        old_name = conn.execute('SELECT display_name FROM customers WHERE id = ?',
+                                                (customer_id,)).fetchone()[0]
+                        conn.execute('UPDATE customers SET display_name = ?, name = ? WHERE id = ?',
+                                     (new_name, new_name.lower(), customer_id))
+                    self.name_index.rename(old_name, new_name)
+                    history_window.display_name = new_name
                     history_window.title(f"Transaction History for {new_name}")
                     messagebox.showinfo("Updated", "Borrower name updated successfully")
                     self.refresh_table()
@@ -1220,12 +889,9 @@ class UtangTrackerApp:
             def update_phone():
                 try:
                     new_phone = phone_var.get().strip()
-                    conn = self.get_db_connection()
-                    cursor = conn.cursor()
-                    cursor.execute('UPDATE customers SET phone_number = ? WHERE id = ?',
-                                   (new_phone if new_phone else None, customer_id))
-                    conn.commit()
-                    conn.close()
+                    with transaction() as conn:
+                        conn.execute('UPDATE customers SET phone_number = ? WHERE id = ?',
+                                     (new_phone if new_phone else None, customer_id))
                     messagebox.showinfo("Updated", "Phone number updated successfully")
                 except Exception as e:
                     messagebox.showerror("Error", f"Failed to update phone number: {str(e)}")
@@ -1248,7 +914,8 @@ class UtangTrackerApp:
             # Updated column name: Actual Borrower -> Co-borrower
             history_columns = ("#", "Date & Time", "Action", "Product", "Quantity", "Amount", "Co-borrower")
             history_tree = ttk.Treeview(tree_frame, columns=history_columns, show="headings",
-                                        yscrollcommand=scrollbar.set)
+                                        yscrollcommand=lambda first, last: self.on_history_scroll(
+                                            history_window, scrollbar, first, last))
             history_tree.pack(fill=tk.BOTH, expand=True)
 
             scrollbar.config(command=history_tree.yview)
@@ -1269,37 +936,11 @@ class UtangTrackerApp:
             history_tree.heading("Co-borrower", text="Co-borrower")
             history_tree.column("Co-borrower", anchor="center", width=150)
 
-            cursor.execute(
-                '''SELECT t.date, t.time, t.action, t.product, t.quantity, t.amount, t.actual_borrower 
-                FROM transactions t
-                WHERE t.customer_id = ? 
-                ORDER BY datetime(t.date || ' ' || t.time) ASC''',
-                (customer_id,)
-            )
-            transactions = cursor.fetchall()
-
-            for row_num, transaction in enumerate(transactions, 1):
-                date, time, action, product, quantity, amount, actual_borrower = transaction
-
-                # Calculate unit price for display purposes
-                unit_price = amount / quantity if quantity > 0 else amount
-                display_amount = amount if action == "Paid" else unit_price * quantity
-
-                dt = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
-                formatted_datetime = dt.strftime("%Y-%m-%d %I:%M %p")
-
-                # Get account name
-                borrower_display = display_name if not actual_borrower else actual_borrower
-
-                history_tree.insert("", "end", values=(
-                    row_num,
-                    formatted_datetime,
-                    action,
-                    product,
-                    quantity,
-                    f"₱{display_amount:.2f}",
-                    borrower_display
-                ))
+            history_window.history_tree = history_tree
+            history_window.display_name = display_name
+            history_window.history_after = None
+            history_window.loading_page = False
+            self.load_history(history_window)
 
             # Action buttons
             btn_frame = tk.Frame(history_window, bg=self.current_bg_color)
@@ -1315,12 +956,51 @@ class UtangTrackerApp:
                                    font=("Arial", 12), width=20, bg=self.button_bg, fg=self.button_fg)
             delete_btn.pack(side=tk.LEFT, padx=10)
 
-            history_window.history_tree = history_tree
+        except Exception as e:
+            messagebox.showerror("Database Error", f"An error occurred: {str(e)}")
 
+    def load_history(self, history_window, limit=LEDGER_PAGE_SIZE):
+        """Show the first page of a history window's ledger, oldest first; later pages load on scroll"""
+        history_tree = history_window.history_tree
+        history_tree.delete(*history_tree.get_children())
+        rows, history_window.history_after = get_ledger_page(history_window.customer_id, limit=limit)
+        self.append_history_rows(history_window, rows)
+
+    def append_history_rows(self, history_window, rows):
+        history_tree = history_window.history_tree
+        for row_num, tx in enumerate(rows, len(history_tree.get_children()) + 1):
+            # Use account name if borrower is empty/None
+            borrower_display = tx.actual_borrower if tx.actual_borrower else history_window.display_name
+
+            # The row's iid is its transaction id, which edit and delete act on
+            history_tree.insert("", "end", iid=tx.id, values=(
+                row_num,
+                format_last_transaction(tx.date, tx.time),
+                tx.action,
+                tx.product,
+                tx.quantity,
+                f"₱{tx.amount:.2f}",
+                borrower_display
+            ))
+
+    def on_history_scroll(self, history_window, scrollbar, first, last):
+        """Keep the scrollbar in step and fetch the next page of the ledger when the view nears the end"""
+        scrollbar.set(first, last)
+        if float(last) > 0.9 and history_window.history_after is not None and not history_window.loading_page:
+            history_window.loading_page = True
+            self.root.after_idle(lambda: self.load_next_history_page(history_window))
+
+    def load_next_history_page(self, history_window):
+        try:
+            if history_window.history_after is None or not history_window.winfo_exists():
+                return
+            rows, history_window.history_after = get_ledger_page(history_window.customer_id,
+                                                                 history_window.history_after)
+            self.append_history_rows(history_window, rows)
         except Exception as e:
             messagebox.showerror("Database Error", f"An error occurred: {str(e)}")
         finally:
-            conn.close()
+            history_window.loading_page = False
 
     def on_history_window_close(self, window):
         """Handle closing of history window"""
@@ -1350,34 +1030,25 @@ class UtangTrackerApp:
             messagebox.showwarning("Selection Required", "Please select a transaction to edit.")
             return
 
-        transaction_values = history_window.history_tree.item(selected_items[0], "values")
-        row_num = transaction_values[0]
+        transaction_id = selected_items[0]
         customer_id = history_window.customer_id
 
-        conn = self.get_db_connection()
-        cursor = conn.cursor()
+        cursor = get_connection().cursor()
 
         try:
-            formatted_datetime = transaction_values[1]
-            action = transaction_values[2]
-
-            dt = datetime.strptime(formatted_datetime, "%Y-%m-%d %I:%M %p")
-            date = dt.strftime("%Y-%m-%d")
-            time = dt.strftime("%H:%M")
-
             cursor.execute(
                 '''SELECT t.id, t.date, t.time, t.action, t.product, t.quantity, t.amount, t.actual_borrower 
                 FROM transactions t
-                WHERE t.customer_id = ? AND t.date = ? AND t.time = ? AND t.action = ?''',
-                (customer_id, date, time, action)
+                WHERE t.id = ? AND t.is_deleted = 0''',
+                (transaction_id,)
             )
-            transaction = cursor.fetchone()
+            tx_row = cursor.fetchone()
 
-            if not transaction:
+            if not tx_row:
                 messagebox.showerror("Error", "Transaction not found.")
                 return
 
-            transaction_id, date, time, action, product, quantity, amount, actual_borrower = transaction
+            transaction_id, date, time, action, product, quantity, amount, actual_borrower = tx_row
 
             cursor.execute('SELECT display_name FROM customers WHERE id = ?', (customer_id,))
             display_name = cursor.fetchone()[0]
@@ -1506,44 +1177,27 @@ class UtangTrackerApp:
                             messagebox.showerror("Input Error", "Amount must be a number.")
                             return
 
-                    balance_adjustment = 0
-
-                    if original_action == "Credit Added":
-                        if updated_action == "Credit Added":
-                            balance_adjustment = updated_amount - original_amount
-                        else:
-                            balance_adjustment = -original_amount - updated_amount
-                    else:
-                        if updated_action == "Paid":
-                            balance_adjustment = original_amount - updated_amount
-                        else:
-                            balance_adjustment = original_amount + updated_amount
-
-                    conn = self.get_db_connection()
-                    cursor = conn.cursor()
-
-                    cursor.execute(
-                        '''UPDATE transactions 
-                        SET date = ?, time = ?, action = ?, product = ?, 
-                        quantity = ?, amount = ?, actual_borrower = ? 
-                        WHERE id = ?''',
-                        (
-                            updated_date, updated_time, updated_action, updated_product,
-                            updated_quantity, updated_amount,
-                            updated_borrower if updated_borrower else None,
-                            transaction_id
-                        )
-                    )
+                    balance_adjustment = (balance_effect(updated_action, updated_amount) -
+                                          balance_effect(original_action, original_amount))
 
-                    cursor.execute(
-                        'UPDATE customers SET balance = balance + ? WHERE id = ?',
-                        (balance_adjustment, customer_id)
-                    )
+                    with transaction() as conn:
+                        cursor = conn.cursor()
 
-                    cursor.execute('SELECT balance FROM customers WHERE id = ?', (customer_id,))
-                    new_balance = cursor.fetchone()[0]
+                        cursor.execute(
+                            '''UPDATE transactions 
+                            SET date = ?, time = ?, occurred_at = ?, action = ?, product = ?, 
+                            quantity = ?, amount = ?, actual_borrower = ? 
+                            WHERE id = ?''',
+                            (
+                                updated_date, updated_time, occurred_at(updated_date, updated_time),
+                                updated_action, updated_product,
+                                updated_quantity, updated_amount,
+                                updated_borrower if updated_borrower else None,
+                                transaction_id
+                            )
+                        )
 
-                    conn.commit()
+                        new_balance = apply_balance_delta(conn, customer_id, balance_adjustment)
 
                     # REMOVED: No longer prompt to remove when balance reaches zero
                     # The customer will simply stay in the list
@@ -1553,12 +1207,7 @@ class UtangTrackerApp:
                     edit_window.destroy()
 
                 except Exception as e:
-                    if conn:
-                        conn.rollback()
                     messagebox.showerror("Error", f"An error occurred: {str(e)}")
-                finally:
-                    if conn:
-                        conn.close()
 
             save_btn = tk.Button(btn_frame, text="Save Changes", command=save_changes,
                                  font=("Arial", 12), bg=self.button_bg, fg=self.button_fg)
@@ -1570,8 +1219,6 @@ class UtangTrackerApp:
 
         except Exception as e:
             messagebox.showerror("Database Error", f"An error occurred: {str(e)}")
-        finally:
-            conn.close()
 
     def on_edit_window_close(self, window):
         """Handle closing of edit window"""
@@ -1585,31 +1232,24 @@ class UtangTrackerApp:
             messagebox.showwarning("Selection Required", "Please select a transaction to delete.")
             return
 
-        transaction_values = history_window.history_tree.item(selected_items[0])['values']
-        formatted_datetime = transaction_values[1]
-        transaction_action = transaction_values[2]
+        transaction_id = selected_items[0]
         customer_id = history_window.customer_id
 
-        dt = datetime.strptime(formatted_datetime, "%Y-%m-%d %I:%M %p")
-        transaction_date = dt.strftime("%Y-%m-%d")
-        transaction_time = dt.strftime("%H:%M")
-
-        conn = self.get_db_connection()
-        cursor = conn.cursor()
+        cursor = get_connection().cursor()
 
         try:
             cursor.execute(
                 '''SELECT id, action, amount FROM transactions 
-                WHERE customer_id = ? AND date = ? AND time = ? AND action = ?''',
-                (customer_id, transaction_date, transaction_time, transaction_action)
+                WHERE id = ? AND is_deleted = 0''',
+                (transaction_id,)
             )
-            transaction = cursor.fetchone()
+            tx_row = cursor.fetchone()
 
-            if not transaction:
+            if not tx_row:
                 messagebox.showerror("Error", "Transaction not found.")
                 return
 
-            transaction_id, action, amount = transaction
+            transaction_id, action, amount = tx_row
 
             cursor.execute('SELECT display_name FROM customers WHERE id = ?', (customer_id,))
             display_name = cursor.fetchone()[0]
@@ -1618,26 +1258,14 @@ class UtangTrackerApp:
                                        f"Are you sure you want to delete this {action} transaction for ₱{amount:.2f}?"):
                 return
 
-            # CHANGED HERE: Updated logic for new action names
-            if action == "Paid":
-                balance_adjustment = amount
-            else:
-                balance_adjustment = -amount
+            with transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM transactions WHERE id = ?', (transaction_id,))
 
-            cursor.execute(
-                'UPDATE customers SET balance = balance + ? WHERE id = ?',
-                (balance_adjustment, customer_id)
-            )
+                new_balance = apply_balance_delta(conn, customer_id, -balance_effect(action, amount))
 
-            cursor.execute('DELETE FROM transactions WHERE id = ?', (transaction_id,))
-
-            cursor.execute('SELECT COUNT(*) FROM transactions WHERE customer_id = ?', (customer_id,))
-            transaction_count = cursor.fetchone()[0]
-
-            cursor.execute('SELECT balance FROM customers WHERE id = ?', (customer_id,))
-            new_balance = cursor.fetchone()[0]
-
-            conn.commit()
+                cursor.execute('SELECT COUNT(*) FROM transactions WHERE customer_id = ?', (customer_id,))
+                transaction_count = cursor.fetchone()[0]
 
             # REMOVED: No longer prompt to remove when balance reaches zero or no transactions
             # The customer will simply stay in the list
@@ -1646,17 +1274,13 @@ class UtangTrackerApp:
             self.refresh_table()
 
         except Exception as e:
-            conn.rollback()
             messagebox.showerror("Database Error", f"An error occurred: {str(e)}")
-        finally:
-            conn.close()
 
     def refresh_transaction_history(self, history_window, customer_id):
-        history_tree = history_window.history_tree
-        history_tree.delete(*history_tree.get_children())
+        # Reload as many rows as are loaded now so the scroll position survives
+        loaded = max(LEDGER_PAGE_SIZE, len(history_window.history_tree.get_children()))
 
-        conn = self.get_db_connection()
-        cursor = conn.cursor()
+        cursor = get_connection().cursor()
 
         try:
             # Get customer info
@@ -1665,6 +1289,7 @@ class UtangTrackerApp:
 
             if customer:
                 display_name, phone_number = customer
+                history_window.display_name = display_name
 
                 # Update phone number display if exists
                 if hasattr(history_window, 'phone_var'):
@@ -1673,113 +1298,87 @@ class UtangTrackerApp:
                 # Update window title
                 history_window.title(f"Transaction History for {display_name}")
 
-            # Get transactions sorted with oldest first (ascending order)
-            cursor.execute(
-                '''SELECT t.date, t.time, t.action, t.product, t.quantity, t.amount, t.actual_borrower 
-                FROM transactions t
-                WHERE t.customer_id = ? 
-                ORDER BY datetime(t.date || ' ' || t.time) ASC''',
-                (customer_id,)
-            )
-            transactions = cursor.fetchall()
-
-            for row_num, transaction in enumerate(transactions, 1):
-                date, time, action, product, quantity, amount, actual_borrower = transaction
-                dt = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
-                formatted_datetime = dt.strftime("%Y-%m-%d %I:%M %p")
-
-                # Get the account name to use as default
-                cursor.execute('SELECT display_name FROM customers WHERE id = ?', (customer_id,))
-                account_name = cursor.fetchone()[0]
-
-                # Use account name if borrower is empty/None
-                borrower_display = account_name if not actual_borrower else actual_borrower
-
-                history_tree.insert("", "end", values=(
-                    row_num,
-                    formatted_datetime,
-                    action,
-                    product,
-                    quantity,
-                    f"₱{amount:.2f}",
-                    borrower_display
-                ))
+            self.load_history(history_window, loaded)
 
         except Exception as e:
             messagebox.showerror("Database Error", f"An error occurred: {str(e)}")
-        finally:
-            conn.close()
 
     def manual_sync(self):
-        """Manual sync for desktop app"""
+        """Manual sync for desktop app; the result is shown in a popup when the worker finishes"""
         try:
             from desktop_sync import desktop_sync
-            import tkinter.messagebox as messagebox
 
             if desktop_sync.is_connected():
-                messagebox.showinfo("Syncing", "Syncing desktop data with cloud...")
-
-                # The sync function now returns a success flag and a message
-                success, message = desktop_sync.sync_all_data()
-
-                if success:
-                    # Show the detailed summary message on success
-                    messagebox.showinfo("Sync Complete", message)
-                    self.refresh_table()
-                else:
-                    # The sync function will show its own error popup,
-                    # but we can log it here if needed.
-                    print(f"Sync failed with message: {message}")
+                self.report_sync_result = True
+                self.sync_worker.request()
             else:
                 messagebox.showerror("Sync Error", "Firebase not configured for desktop app")
 
         except ImportError as e:
-            import tkinter.messagebox as messagebox
             messagebox.showerror("Sync Error", f"Desktop sync module not found: {e}")
+
+    def run_sync_job(self):
+        """Sync worker body: talks to Firestore off the Tk thread, so it must not touch widgets"""
+        from desktop_sync import desktop_sync
+        if not desktop_sync.is_connected():
+            return False, "Firebase not connected"
+        return desktop_sync.sync_all_data()
+
+    def on_sync_done(self, result):
+        """Apply a finished sync on the Tk thread"""
+        success, message = result
+        report, self.report_sync_result = self.report_sync_result, False
+        if success:
+            self.sync_status_var.set(f"Cloud sync: last synced {datetime.now().strftime('%I:%M %p')}")
+            print("Sync successful. Refreshing table.")
+            self.reload_synced_data()
+            if report:
+                messagebox.showinfo("Sync Complete", message)
+        else:
+            self.sync_status_var.set("Cloud sync: failed, will retry")
+            print(f"Sync failed: {message}")
+            if report:
+                messagebox.showerror("Sync Error", message)
+
+    def reload_synced_data(self):
+        """Show rows a sync or the live listener changed: names, table and open history windows"""
+        self.name_index.reset(self.get_all_borrower_names())
+        self.refresh_table()
+        for window in self.open_windows:
+            if hasattr(window, 'customer_id'):
+                self.refresh_transaction_history(window, window.customer_id)
+
+    def start_live_sync(self):
+        """Listen for other devices' changes; the periodic sync job keeps pulling only if the listener drops."""
+        try:
+            from desktop_sync import desktop_sync
+            if desktop_sync.start_listening(post=lambda callback: self.root.after(0, callback),
+                                            on_applied=self.on_remote_changes):
+                self.sync_status_var.set("Cloud sync: live")
         except Exception as e:
-            import tkinter.messagebox as messagebox
-            messagebox.showerror("Sync Error", f"An unexpected error occurred during sync: {str(e)}")
+            print(f"Live sync unavailable, using periodic sync: {e}")
+
+    def on_remote_changes(self, count):
+        """Listener applied remote changes on its worker; refresh on the Tk thread"""
+        print(f"Applied {count} remote change(s).")
+        self.sync_status_var.set(f"Cloud sync: live, updated {datetime.now().strftime('%I:%M %p')}")
+        self.reload_synced_data()
 
     def auto_sync(self):
-        """Automatically sync data with the cloud and run maintenance tasks."""
+        """Periodic sync job: hand a sync to the worker, which runs at most one at a time."""
         print("Performing automatic background sync...")
         try:
             from desktop_sync import desktop_sync
             if desktop_sync.is_connected():
-                success, message = desktop_sync.sync_all_data()
-                if success:
-                    print("Auto-sync successful. Refreshing table.")
-                    self.refresh_table()
-                    # Also refresh any open history windows
-                    for window in self.open_windows:
-                        if hasattr(window, 'customer_id'):
-                            self.refresh_transaction_history(window, window.customer_id)
-                else:
-                    print(f"Auto-sync failed: {message}")
+                self.sync_worker.request()
             else:
+                self.sync_status_var.set("Cloud sync: offline")
                 print("Firebase not connected, skipping auto-sync.")
         except Exception as e:
             print(f"An error occurred during auto-sync: {e}")
             import traceback
             traceback.print_exc()
 
-        # Run auto-delete for zero balance customers
-        self.auto_delete_zero_balance()
-
-        # Schedule the next sync: 300000 milliseconds = 5 minutes
-        self.root.after(300000, self.auto_sync)
-
-    def get_db_connection(self):
-        """Get database connection for desktop app"""
-        if getattr(sys, 'frozen', False):
-            app_dir = os.path.dirname(sys.executable)
-        else:
-            app_dir = os.path.dirname(os.path.abspath(__file__))
-
-        db_path = os.path.join(app_dir, 'data', 'utracker.db')
-        return sqlite3.connect(db_path)
-
-
 if __name__ == "__main__":
     import sys
 